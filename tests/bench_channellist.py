@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# Loading a large channel list: the old ChannelList (a new connection per
+# property, SELECT * with the icon blobs, every row fetched at once) against
+# iter_channels() on one persistent connection, icons left in the database.
+#
+#   python tests/bench_channellist.py [--channels N] [--icon-size BYTES]
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tv-maxe'))
+
+import paths
+from models.channel import Channel
+from models.channellist import ChannelList
+
+def make_list(path, channels, icon_size):
+    # Nine TV channels for every radio channel, each with an icon
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("CREATE TABLE info (name text, version text, author text, url text, epgurl text)")
+    c.execute("CREATE TABLE radio_channels (id text, icon blob, name text, streamurls text, params text)")
+    c.execute("CREATE TABLE tv_channels (id text, icon blob, name text, streamurls text, params text, guide text, audiochannels text)")
+    c.execute("INSERT INTO info VALUES (?, ?, ?, ?, ?)", ("Benchmark", "1.0", "bench", "", ""))
+    icon = os.urandom(icon_size)
+    for index in range(channels):
+        streamurls = json.dumps(['http://example.com/{0}.ts'.format(index), 'sop://example.com:3912/{0}'.format(index)])
+        if index % 10:
+            c.execute("INSERT INTO tv_channels VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                'tv{0}'.format(index), icon, 'Channel {0}'.format(index), streamurls, '{}', 'guide{0}'.format(index), '[]'
+            ))
+        else:
+            c.execute("INSERT INTO radio_channels VALUES (?, ?, ?, ?, ?)", (
+                'radio{0}'.format(index), icon, 'Radio {0}'.format(index), streamurls, '{}'
+            ))
+    conn.commit()
+    conn.close()
+
+def old_query(path, query):
+    # What each ChannelList property did before: connect, query, close
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    c.execute(query)
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def load_old(path):
+    old_query(path, "SELECT * FROM info")[0]['name']
+    old_query(path, "SELECT * FROM info")[0]['epgurl']
+    channels = [Channel(row, 'tv', path) for row in old_query(path, "SELECT * FROM tv_channels")]
+    channels += [Channel(row, 'radio', path) for row in old_query(path, "SELECT * FROM radio_channels")]
+    return len(channels)
+
+def load_new(path):
+    paths.LOCAL_CHANNEL_DB = path
+    chlist = ChannelList()
+    chlist.name
+    chlist.epg_url
+    count = sum(len(batch) for batch in chlist.iter_channels())
+    chlist.close()
+    return count
+
+def timed(function, path, repeat):
+    best = None
+    for i in range(repeat):
+        started = time.perf_counter()
+        count = function(path)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+def main():
+    parser = argparse.ArgumentParser(description='Channel list loading benchmark')
+    parser.add_argument('--channels', type=int, default=20000)
+    parser.add_argument('--icon-size', type=int, default=4096)
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'bench.db')
+    local_channel_db = paths.LOCAL_CHANNEL_DB
+    try:
+        make_list(path, args.channels, args.icon_size)
+        print('{0} channels, {1} byte icons, {2:.1f} MB'.format(
+            args.channels, args.icon_size, os.path.getsize(path) / 1024 / 1024
+        ))
+        old, old_count = timed(load_old, path, args.repeat)
+        new, new_count = timed(load_new, path, args.repeat)
+        assert old_count == new_count == args.channels
+        print('connection per query, SELECT *:  {0:.3f}s'.format(old))
+        print('iter_channels():                 {0:.3f}s'.format(new))
+        print('speedup:                         {0:.1f}x'.format(old / new))
+    finally:
+        paths.LOCAL_CHANNEL_DB = local_channel_db
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
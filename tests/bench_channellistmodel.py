@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Adding a large channel list to the UI: the old ChannelListWidget, which
+# looked for an existing channel by walking every item before adding one,
+# against ChannelListModel.addChannels() and its channel id -> row map.
+# Needs PyQt5; runs on the offscreen platform, no display required.
+#
+#   python tests/bench_channellistmodel.py [--channels N] [--batch-size N]
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tv-maxe'))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication
+
+from models.channel import Channel
+from channellistmodel import ChannelListModel
+
+def make_channels(channels):
+    return [Channel({
+        'id': 'tv{0}'.format(index),
+        'name': 'Channel {0}'.format(index),
+        'streamurls': json.dumps(['http://example.com/{0}.ts'.format(index)])
+    }) for index in range(channels)]
+
+def batches(channels, batch_size):
+    for index in range(0, len(channels), batch_size):
+        yield channels[index:index + batch_size]
+
+def add_old(channels, batch_size):
+    # ChannelListWidget.addChannel() before the id index: channelExists()
+    # went through every item added so far
+    items = []
+    for batch in batches(channels, batch_size):
+        for channel in batch:
+            exists = False
+            for item in items:
+                if item.id == channel.id:
+                    exists = True
+                    break
+            if not exists:
+                items.append(channel)
+    return len(items)
+
+def add_new(channels, batch_size):
+    model = ChannelListModel(set())
+    for batch in batches(channels, batch_size):
+        model.addChannels(batch)
+    assert all(model.channelExists(channel) for channel in channels)
+    return model.rowCount()
+
+def timed(function, *args):
+    started = time.perf_counter()
+    count = function(*args)
+    return time.perf_counter() - started, count
+
+def main():
+    parser = argparse.ArgumentParser(description='Channel list model benchmark')
+    parser.add_argument('--channels', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=100, help='channels per addChannels() call')
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    app.protocol_plugins = {'http': object}  # removeUnsupportedStreams() only looks the scheme up
+
+    channels = make_channels(args.channels)
+    print('{0} channels in batches of {1}'.format(args.channels, args.batch_size))
+    old, old_count = timed(add_old, channels, args.batch_size)
+    new, new_count = timed(add_new, channels, args.batch_size)
+    assert old_count == new_count == args.channels
+    print('linear channelExists():       {0:.3f}s'.format(old))
+    print('ChannelListModel.addChannels: {0:.3f}s'.format(new))
+    print('speedup:                      {0:.1f}x'.format(old / new))
+
+
+if __name__ == '__main__':
+    main()
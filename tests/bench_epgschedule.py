@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# Converting a week of guides for a few hundred channels to local time: the
+# old util.toLocalTime() once per row against EPGSchedule, which parses each
+# guide once and converts its whole time column in one pass.
+#
+#   python tests/bench_epgschedule.py [--channels N] [--days N] [--entries N]
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tv-maxe'))
+
+from epgschedule import EPGSchedule
+
+def old_to_local_time(hhmm):
+    # util.toLocalTime before EPGSchedule, kept here for comparison
+    import time, datetime
+    diff = time.timezone
+    diff = -diff
+    now = datetime.datetime.strptime(hhmm, "%H:%M")
+    delta = datetime.timedelta(seconds=diff)
+    newtime = now + delta
+    h = str(newtime.hour)
+    m = str(newtime.minute)
+    if len(h) == 1:
+        h = '0' + h
+    if len(m) == 1:
+        m = '0' + m
+    return h + ':' + m
+
+def make_guides(channels, days, entries):
+    # {date_str: [epg_list per channel]}, each guide a day of shows in
+    # airing order starting late on the previous UTC day
+    rand = random.Random(0)
+    first_day = datetime.date.today()
+    guides = {}
+    for day in range(days):
+        date_str = (first_day + datetime.timedelta(days=day)).strftime("%Y-%m-%d")
+        guides[date_str] = []
+        for channel in range(channels):
+            minutes = sorted(rand.sample(range(24 * 60), entries))
+            guides[date_str].append([
+                ['%02d:%02d' % divmod((minute - 180) % (24 * 60), 60), 'Show {0}'.format(index)]
+                for index, minute in enumerate(minutes)
+            ])
+    return guides
+
+def run_old(guides):
+    for date_str, epg_lists in guides.items():
+        for epg_list in epg_lists:
+            [(old_to_local_time(epg_line[0]), epg_line[1]) for epg_line in epg_list]
+
+def run_new(guides):
+    for date_str, epg_lists in guides.items():
+        for epg_list in epg_lists:
+            schedule = EPGSchedule(epg_list, date_str)
+            [(schedule.local_time(index), schedule.titles[index]) for index in range(len(schedule))]
+
+def timed(function, *args):
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='EPG local time conversion benchmark')
+    parser.add_argument('--channels', type=int, default=300)
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--entries', type=int, default=40, help='shows per channel per day')
+    args = parser.parse_args()
+
+    guides = make_guides(args.channels, args.days, args.entries)
+    rows = args.channels * args.days * args.entries
+    print('{0} channels x {1} days x {2} shows = {3} rows'.format(args.channels, args.days, args.entries, rows))
+
+    old = timed(run_old, guides)
+    new = timed(run_new, guides)
+    print('toLocalTime per row:  {0:.3f}s ({1:.2f}us/row)'.format(old, old / rows * 1e6))
+    print('EPGSchedule:          {0:.3f}s ({1:.2f}us/row)'.format(new, new / rows * 1e6))
+    print('speedup:              {0:.1f}x'.format(old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import calendar
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tv-maxe'))
+
+from epgschedule import EPGSchedule
+
+def utc(text):
+    return calendar.timegm(time.strptime(text, "%Y-%m-%d %H:%M"))
+
+
+@unittest.skipUnless(hasattr(time, 'tzset'), 'needs time.tzset()')
+class EPGScheduleTest(unittest.TestCase):
+    # Guides list a local day in UTC times; Europe/Bucharest is UTC+3 in
+    # summer and UTC+2 in winter
+    timezone = 'Europe/Bucharest'
+
+    def setUp(self):
+        self.saved_tz = os.environ.get('TZ')
+        os.environ['TZ'] = self.timezone
+        time.tzset()
+
+    def tearDown(self):
+        if self.saved_tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = self.saved_tz
+        time.tzset()
+
+    def test_first_show_on_previous_utc_day(self):
+        schedule = EPGSchedule([['21:15', 'a'], ['03:00', 'b'], ['09:00', 'c'], ['17:00', 'd']], '2026-10-18')
+        self.assertEqual(schedule.starts, [
+            utc('2026-10-17 21:15'), utc('2026-10-18 03:00'), utc('2026-10-18 09:00'), utc('2026-10-18 17:00')
+        ])
+        self.assertEqual([schedule.local_time(i) for i in range(len(schedule))], ['00:15', '06:00', '12:00', '20:00'])
+        self.assertEqual(schedule.current(utc('2026-10-18 09:30')), (utc('2026-10-18 09:00'), 'c'))
+        self.assertEqual(schedule.current(utc('2026-10-17 22:00')), (utc('2026-10-17 21:15'), 'a'))
+
+    def test_first_show_on_same_utc_day(self):
+        schedule = EPGSchedule([['06:00', 'a'], ['12:00', 'b'], ['22:30', 'c'], ['01:00', 'd']], '2026-10-18')
+        self.assertEqual(schedule.starts[0], utc('2026-10-18 06:00'))
+        self.assertEqual(schedule.starts[-1], utc('2026-10-19 01:00'))
+        self.assertEqual(schedule.local_time(3), '04:00')
+
+    def test_dst_switch_day(self):
+        # Clocks go forward at 03:00 local (01:00 UTC) on 2026-03-29
+        schedule = EPGSchedule([['00:30', 'a'], ['12:00', 'b']], '2026-03-29')
+        self.assertEqual([schedule.local_time(i) for i in range(len(schedule))], ['02:30', '15:00'])
+
+    def test_progress(self):
+        schedule = EPGSchedule([['21:15', 'a'], ['03:00', 'b'], ['09:00', 'c']], '2026-10-18')
+        self.assertEqual(schedule.progress(utc('2026-10-18 04:00')), (3600, 6 * 3600))
+        self.assertEqual(schedule.next_boundary(utc('2026-10-18 04:00')), utc('2026-10-18 09:00'))
+
+    def test_invalid_entries_skipped(self):
+        schedule = EPGSchedule([['bad', 'x'], ['10:00', 'a'], [None, 'y'], ['11:00', 'b']], '2026-10-18')
+        self.assertEqual(schedule.titles, ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
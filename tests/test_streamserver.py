@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+import shutil
+import struct
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tv-maxe'))
+
+import paths
+from relay import StreamRelay
+from streamserver import StreamServer
+from timeshift import Timeshift
+
+CHUNK_SIZE = 64 * 1024
+
+def counter_stream(size):
+    # Big-endian word counter: any gap or out of order data in what a client
+    # receives shows up as words that don't strictly increase
+    return b''.join(struct.pack('>I', i) for i in range(size // 4))
+
+def words(data):
+    return struct.unpack('>{0}I'.format(len(data) // 4), data[:len(data) // 4 * 4])
+
+
+class BytesSource:
+    # A finite stream read in pieces, optionally slowed down per read
+    def __init__(self, data, delay=0):
+        self.data = data
+        self.pos = 0
+        self.delay = delay
+        self.started = threading.Event()
+
+    def read(self, size):
+        self.started.wait()
+        if self.delay:
+            time.sleep(self.delay)
+        data = self.data[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+
+class StreamServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StreamServer()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def get(self, path, headers=None, method='GET'):
+        request = urllib.request.Request(self.server.url_for(path), headers=headers or {}, method=method)
+        return urllib.request.urlopen(request, timeout=10)
+
+    def test_unknown_path(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.get('/missing')
+        self.assertEqual(context.exception.code, 404)
+
+    def test_listen_reuses_port(self):
+        self.assertEqual(self.server.listen(), self.server.listen())
+
+    def test_concurrent_relay_clients(self):
+        data = counter_stream(4 * 1024 * 1024)
+        source = BytesSource(data)
+        relay = StreamRelay(source, capacity=len(data) + 2 * CHUNK_SIZE)
+        self.server.add_endpoint('/relay', relay.endpoint('video/mp2t'))
+        relay.start()
+
+        results = {}
+        def client(index):
+            with self.get('/relay') as response:
+                results[index] = (response.headers['Content-Type'], response.read())
+
+        clients = [threading.Thread(target=client, args=(index, )) for index in range(4)]
+        for thread in clients:
+            thread.start()
+        while relay.clients < len(clients):
+            time.sleep(0.01)
+        source.started.set()
+        for thread in clients:
+            thread.join(10)
+
+        self.assertEqual(len(results), len(clients))
+        for content_type, body in results.values():
+            self.assertEqual(content_type, 'video/mp2t')
+            self.assertEqual(body, data)
+        self.assertEqual(relay.dropped, 0)
+
+    def test_head_request(self):
+        relay = StreamRelay(BytesSource(b''))
+        self.server.add_endpoint('/relay', relay.endpoint('video/x-flv'))
+        with self.get('/relay', method='HEAD') as response:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.headers['Content-Type'], 'video/x-flv')
+        relay.stop()
+
+    def test_slow_client_never_gets_overwritten_data(self):
+        source = BytesSource(counter_stream(16 * 1024 * 1024), delay=0.0005)
+        source.started.set()
+        relay = StreamRelay(source, capacity=4 * CHUNK_SIZE)
+        self.server.add_endpoint('/relay', relay.endpoint('video/mp2t'))
+        relay.start()
+
+        received = bytearray()
+        with self.get('/relay') as response:
+            data = response.read(CHUNK_SIZE)
+            while data:
+                received += data
+                time.sleep(0.002)
+                data = response.read(CHUNK_SIZE)
+
+        self.assertGreater(relay.dropped, 0)
+        values = words(received)
+        self.assertTrue(all(a < b for a, b in zip(values, values[1:])))
+
+    def test_removed_endpoint_disconnects_clients(self):
+        source = BytesSource(counter_stream(1024 * 1024), delay=0.05)
+        source.started.set()
+        relay = StreamRelay(source)
+        self.server.add_endpoint('/relay', relay.endpoint('video/mp2t'))
+        relay.start()
+
+        with self.get('/relay') as response:
+            response.read(1024)
+            self.server.remove_endpoint('/relay')
+            response.read()
+        relay.stop()
+        with self.assertRaises(urllib.error.HTTPError):
+            self.get('/relay')
+
+    def test_stop_with_connected_client(self):
+        source = BytesSource(counter_stream(1024 * 1024), delay=0.05)
+        source.started.set()
+        relay = StreamRelay(source)
+        self.server.add_endpoint('/relay', relay.endpoint('video/mp2t'))
+        relay.start()
+
+        response = self.get('/relay')
+        response.read(1024)
+        started = time.perf_counter()
+        self.server.stop()
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertEqual(self.server.stats(), [])
+        response.close()
+        relay.stop()
+
+
+class TimeshiftTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.timeshift_dir = paths.TIMESHIFT_DIR
+        paths.TIMESHIFT_DIR = self.directory
+        self.server = StreamServer()
+        self.timeshift = None
+
+    def tearDown(self):
+        if self.timeshift:
+            self.timeshift.stop()
+        self.server.stop()
+        paths.TIMESHIFT_DIR = self.timeshift_dir
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def start(self, data, window, segment_size):
+        async def upstream(request, response):
+            await response.send_headers(200)
+            await response.write(data)
+        self.server.add_endpoint('/upstream', upstream)
+
+        self.timeshift = Timeshift(self.server, self.server.url_for('/upstream'), window, segment_size)
+        url = self.timeshift.start()
+        while not self.timeshift.relay.closed:
+            time.sleep(0.01)
+        return url
+
+    def get(self, url, headers=None):
+        return urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=10)
+
+    def test_plain_read(self):
+        data = counter_stream(512 * 1024)
+        url = self.start(data, 1024 * 1024, 256 * 1024)
+        with self.get(url) as response:
+            self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+            self.assertEqual(response.read(), data)
+
+    def test_range_read(self):
+        data = counter_stream(512 * 1024)
+        url = self.start(data, 1024 * 1024, 256 * 1024)
+        with self.get(url, {'Range': 'bytes=300000-'}) as response:
+            self.assertEqual(response.status, 206)
+            self.assertEqual(response.headers['Content-Range'], 'bytes 300000-/*')
+            self.assertEqual(response.read(), data[300000:])
+
+    def test_range_outside_window(self):
+        data = counter_stream(2 * 1024 * 1024)
+        url = self.start(data, 512 * 1024, 256 * 1024)
+        for start in [0, len(data) + 1]:
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                self.get(url, {'Range': 'bytes={0}-'.format(start)})
+            self.assertEqual(context.exception.code, 416)
+
+    def test_segments_removed_on_stop(self):
+        self.start(counter_stream(512 * 1024), 1024 * 1024, 256 * 1024)
+        self.assertTrue(os.listdir(self.directory))
+        self.timeshift.stop()
+        self.timeshift = None
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
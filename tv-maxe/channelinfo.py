@@ -1,10 +1,10 @@
 from urllib.parse import urlparse
 from PyQt5 import uic
-from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QDialog, QAbstractItemView
-from PyQt5.QtGui import QImage, QPixmap, QStandardItemModel, QStandardItem
+from PyQt5.QtGui import QStandardItemModel, QStandardItem
 
-from channellistmanager import ChannelListManager
+from models.channellist import ChannelList
+from iconcache import ThumbnailCache
 
 class ChannelInfoDialog(QDialog):
     def __init__(self, channel, parent=None):
@@ -20,21 +20,12 @@ class ChannelInfoDialog(QDialog):
         self.streams_treeview.setModel(model)
         self.streams_treeview.setColumnWidth(0, 80)
 
-        image = QImage()
-        image.loadFromData(channel.icon)
         self.icon_label.setPixmap(
-            QPixmap.fromImage(image).scaled(
-                self.icon_label.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
+            ThumbnailCache.pixmap(channel.icon, self.icon_label.size(), self.devicePixelRatioF())
         )
         self.channel_name_label.setText(channel.name)
 
-        origin_chlist = None
-        for chlist in ChannelListManager.channellists:
-            if chlist.origin_url == channel.origin:
-                origin_chlist = chlist
+        origin_chlist = ChannelList.loaded.get(channel.origin)
         self.channel_list_label.setText(origin_chlist.name)
         self.channel_list_url.setText("({0})".format(channel.origin))
 
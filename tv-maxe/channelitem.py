@@ -1,31 +0,0 @@
-from urllib.parse import urlparse
-from PyQt5.QtWidgets import QApplication, QListWidgetItem
-from PyQt5.QtGui import QIcon, QImage, QPixmap
-
-class ChannelItem(QListWidgetItem):
-    __channel = None
-
-    def __init__(self, channel, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.channel = channel
-
-    @property
-    def channel(self):
-        return self.__channel
-
-    @channel.setter
-    def channel(self, channel):
-        self.__channel = channel
-        if channel:
-            image = QImage()
-            image.loadFromData(channel.icon)
-            self.setText(channel.name)
-            self.setIcon(QIcon(QPixmap.fromImage(image)))
-
-            protocol_plugins = QApplication.instance().protocol_plugins
-            for idx, streamurl in enumerate(channel.streamurls):
-                url_comps = urlparse(streamurl)
-                schema = url_comps.scheme
-                if not protocol_plugins.get(schema, None):
-                    channel.streamurls.pop(idx)
-
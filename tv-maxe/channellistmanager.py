@@ -2,63 +2,108 @@ import os
 import threading
 import logging
 from urllib.parse import urlparse
-from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkRequest, QNetworkReply
-from PyQt5.QtCore import pyqtSignal, QUrl, QObject, qDebug
+from PyQt5.QtNetwork import QNetworkRequest, QNetworkReply
+from PyQt5.QtCore import pyqtSignal, QUrl, QObject, QTimer, qDebug
+from PyQt5.QtWidgets import QApplication
 
 import paths
+from util import bytes2human
+from iconcache import ThumbnailCache
 from models.channellist import ChannelList
+from models.channeldiff import ChannelListDiff
+from models.cacheindex import CacheIndex
+from models.cachefile import CacheFile
 from models.channel import Channel
 
 log = logging.getLogger(__name__)
 
 class ChannelListManager(QObject):
     channellist_available = pyqtSignal(ChannelList)
-    channel_added = pyqtSignal(Channel)
+    channels_added = pyqtSignal(list)
+    channels_changed = pyqtSignal(list)
+    channels_removed = pyqtSignal(list)
     channel_removed = pyqtSignal(Channel)
 
-    channellists = set()
     user_channellist = None
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending_loads = {}
+        self.batch_load_scheduled = False
+        self.not_modified_count = 0
+        self.bytes_saved = 0
+        self.downloads = {}  # NetworkJob -> CacheFile
+        QApplication.instance().aboutToQuit.connect(self.close_chlists)
+
+    def add_chlist(self, chlist):
+        current = ChannelList.loaded.get(chlist.origin_url)
+        if current and current is not chlist:
+            current.close()
+        ChannelList.loaded[chlist.origin_url] = chlist
+
+    def chlist_for_url(self, origin_url):
+        return ChannelList.loaded.get(origin_url)
+
+    def release_chlist(self, origin_url):
+        self.pending_loads.pop(origin_url, None)
+        chlist = ChannelList.loaded.pop(origin_url, None)
+        if chlist:
+            chlist.close()
+
+    def close_chlists(self):
+        for chlist in ChannelList.loaded.values():
+            chlist.close()
+        ChannelList.loaded.clear()
+
     def load_user_chlist(self):
+        self.release_chlist(paths.LOCAL_CHANNEL_DB)
         if os.path.isfile(paths.LOCAL_CHANNEL_DB):
-            fh = open(paths.LOCAL_CHANNEL_DB, 'rb')
-            data = fh.read()
-            fh.close()
-
-            ChannelListManager.user_channellist = ChannelList(data)
+            ChannelListManager.user_channellist = ChannelList()
             self.load_chlist(ChannelListManager.user_channellist)
         else:
             ChannelListManager.user_channellist = ChannelList.create_user_db()
-        ChannelListManager.channellists.add(ChannelListManager.user_channellist)
+        self.add_chlist(ChannelListManager.user_channellist)
         self.channellist_available.emit(ChannelListManager.user_channellist)
 
     def load_cached_chlists(self, subscriptions):
+        CacheIndex.migrate_legacy([subscription[1] for subscription in subscriptions])
+
         for subscription in subscriptions:
             if subscription[0] == True:
-                cached_path = ChannelList.local_filename_for_url(subscription[1])
-                if os.path.isfile(cached_path):
-                    fh = open(cached_path, 'rb')
-                    data = fh.read()
-                    fh.close()
-
-                    chlist = ChannelList(data, subscription[1])
+                cached_path = CacheIndex.cached_path(subscription[1])
+                if cached_path:
+                    self.release_chlist(subscription[1])
                     try:
+                        chlist = ChannelList(subscription[1])
                         self.load_chlist(chlist)
-                        ChannelListManager.channellists.add(chlist)
+                        self.add_chlist(chlist)
                         self.channellist_available.emit(chlist)
                     except Exception as e:
                         log.error('Failed to process cached database at {0}: {1}'.format(
-                            chlist.cached_path,
+                            cached_path,
                             e
                         ))
+                        self.release_chlist(subscription[1])
+                        self.remove_cached_chlist(subscription[1])
 
     def clear_cached_chlists(self, subscriptions):
         for subscription in subscriptions:
-            cached_path = ChannelList.local_filename_for_url(subscription[1])
-            if os.path.isfile(cached_path):
-                os.remove(cached_path)
+            self.release_chlist(subscription[1])
+            self.remove_cached_chlist(subscription[1])
+
+    def remove_cached_chlist(self, url):
+        cached_path = ChannelList.local_filename_for_url(url)
+        if os.path.isfile(cached_path):
+            os.remove(cached_path)
+        ChannelList.remove_journal(cached_path)
+        CacheIndex.remove(url)
 
     def download_chlists(self, subscriptions):
+        for response in list(self.downloads):
+            response.abort()
+        CacheFile.remove_stale()
+        ThumbnailCache.prune()
+
         self.load_user_chlist()
         self.load_cached_chlists(subscriptions)
 
@@ -66,40 +111,169 @@ class ChannelListManager(QObject):
         for subscription in subscriptions:
             if subscription[0] == True:
                 urls.append(QUrl(subscription[1]))
-        self.access_manager = QNetworkAccessManager()
-        self.access_manager.finished.connect(self.handle_response)
-
         for url in urls:
             request = QNetworkRequest()
             request.setUrl(url)
-            self.access_manager.get(request)
+            # Lists are cached and revalidated by us, keep them out of the HTTP cache
+            request.setAttribute(QNetworkRequest.CacheLoadControlAttribute, QNetworkRequest.AlwaysNetwork)
+            request.setAttribute(QNetworkRequest.CacheSaveControlAttribute, False)
+            self.set_conditional_headers(request, url.toString())
+            response = QApplication.instance().network.get(request)
+            self.downloads[response] = None
+            response.ready_read.connect(self.handle_ready_read)
+            response.finished.connect(self.handle_response)
+
+    def handle_ready_read(self, response):
+        # Write the list to disk as it arrives instead of buffering all of it
+        if response.attribute(QNetworkRequest.HttpStatusCodeAttribute) != 200:
+            return
+        if response not in self.downloads:
+            return
+
+        cache_file = self.downloads[response]
+        if not cache_file:
+            cache_file = self.downloads[response] = CacheFile()
+        cache_file.write(bytes(response.readAll()))
+
+    def set_conditional_headers(self, request, url):
+        # Validators are only useful if we still have the list they describe
+        entry = CacheIndex.get(url)
+        if not entry:
+            return
+
+        if entry.get('etag'):
+            request.setRawHeader(b'If-None-Match', entry['etag'].encode('latin-1'))
+        if entry.get('last_modified'):
+            request.setRawHeader(b'If-Modified-Since', entry['last_modified'].encode('latin-1'))
+
+    def store_validators(self, response, url):
+        validators = {'etag': None, 'last_modified': None}
+        if response.hasRawHeader(b'ETag'):
+            validators['etag'] = bytes(response.rawHeader(b'ETag')).decode('latin-1')
+        if response.hasRawHeader(b'Last-Modified'):
+            validators['last_modified'] = bytes(response.rawHeader(b'Last-Modified')).decode('latin-1')
+        CacheIndex.update(url, **validators)
+
+    def clear_validators(self, url):
+        if CacheIndex.get(url):
+            CacheIndex.update(url, etag=None, last_modified=None)
 
     def handle_response(self, response):
         url = response.url().toString()
+        status_code = response.attribute(QNetworkRequest.HttpStatusCodeAttribute)
 
-        if response.error() == QNetworkReply.NoError:
+        if response.error() == QNetworkReply.NoError and status_code == 200:
+            self.handle_ready_read(response)
+        cache_file = self.downloads.pop(response, None)
+
+        if response.error() == QNetworkReply.NoError and status_code == 304:
+            self.not_modified_count += 1
+            self.bytes_saved += (CacheIndex.get(url) or {}).get('size', 0)
+            log.debug('Channel list not modified: {0} ({1} lists, {2} saved so far)'.format(
+                url,
+                self.not_modified_count,
+                bytes2human(self.bytes_saved)
+            ))
+        elif response.error() == QNetworkReply.NoError and cache_file:
             log.debug('Downloaded channel list: {0}'.format(url))
-            data = response.readAll()
-            chlist = ChannelList(data, url)
+            if not cache_file.is_valid():
+                cache_file.abort()
+                log.error('Downloaded channel list is not a valid database: {0}'.format(url))
+                return
+
+            old_snapshot = self.snapshot_chlist(url)
+            self.release_chlist(url)
+            try:
+                cache_file.commit(ChannelList.local_filename_for_url(url))
+            except Exception as e:
+                log.error('Failed to store channel list {0}: {1}'.format(url, e))
+                self.load_cached_chlists([[True, url]])
+                return
+            CacheIndex.stored(url, cache_file.size)
+            chlist = ChannelList(url)
+            self.add_chlist(chlist)  # channels kept by the merge read their icons from it
 
             try:
-                self.load_chlist(chlist)
-                ChannelListManager.channellists.add(chlist)
+                if old_snapshot is not None:
+                    self.merge_chlist(chlist, old_snapshot)
+                else:
+                    self.load_chlist(chlist)
+                self.store_validators(response, url)
                 self.channellist_available.emit(chlist)
             except Exception as e:
+                self.release_chlist(url)
+                self.clear_validators(url)
                 log.error('Failed to process `{0}` ({1}): {2}'.format(
                     os.path.basename(chlist.origin_url),
                     chlist.cached_path,
                     e
                 ))
         else:
+            if cache_file:
+                cache_file.abort()
             log.error('Failed to download channel list: {0}'.format(url))
 
     def load_chlist(self, chlist):
         log.debug('Processing channel list: {0}'.format(chlist.origin_url))
 
-        for channel in chlist.tv_channels + chlist.radio_channels:
-            self.channel_added.emit(channel)
+        # The first batch is read right away so a broken database is reported
+        # to the caller, the rest is streamed from the event loop
+        batches = chlist.iter_channels()
+        self.channels_added.emit(next(batches, []))
+        self.pending_loads[chlist.origin_url] = batches
+        self.schedule_batch_load()
+
+    def snapshot_chlist(self, origin_url):
+        # Only a list that was fully handed to the UI can be merged into,
+        # anything else gets a regular load
+        chlist = self.chlist_for_url(origin_url)
+        if not chlist or origin_url in self.pending_loads:
+            return None
+        try:
+            return chlist.snapshot()
+        except Exception as e:
+            log.debug('Cannot snapshot channel list {0}: {1}'.format(origin_url, e))
+            return None
+
+    def merge_chlist(self, chlist, old_snapshot):
+        diff = ChannelListDiff(old_snapshot, chlist.snapshot())
+        log.debug('Merging channel list {0}: {1}'.format(chlist.origin_url, diff))
+
+        if diff.removed:
+            self.channels_removed.emit(
+                [Channel(row, channel_type, chlist.origin_url) for channel_type, row, table in diff.removed]
+            )
+        if diff.changed:
+            self.channels_changed.emit(
+                [chlist.channel_from_row(row, channel_type, table) for channel_type, row, table in diff.changed]
+            )
+        if diff.added:
+            self.channels_added.emit(
+                [chlist.channel_from_row(row, channel_type, table) for channel_type, row, table in diff.added]
+            )
+
+    def schedule_batch_load(self):
+        if not self.batch_load_scheduled:
+            self.batch_load_scheduled = True
+            QTimer.singleShot(0, self.load_pending_batches)
+
+    def load_pending_batches(self):
+        self.batch_load_scheduled = False
+        for origin_url, batches in list(self.pending_loads.items()):
+            try:
+                channels = next(batches, None)
+            except Exception as e:
+                log.error('Failed to process channel list {0}: {1}'.format(origin_url, e))
+                channels = None
+
+            if channels is None:
+                log.debug('Finished loading channel list: {0}'.format(origin_url))
+                self.pending_loads.pop(origin_url, None)
+            else:
+                self.channels_added.emit(channels)
+
+        if self.pending_loads:
+            self.schedule_batch_load()
 
     def save_user_channel(self, channel):
         ChannelListManager.user_channellist.save_channel(channel)
\ No newline at end of file
@@ -0,0 +1,148 @@
+from urllib.parse import urlparse
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import Qt, QAbstractListModel, QSortFilterProxyModel, QModelIndex, QSize
+from PyQt5.QtGui import QBrush, QColor
+
+from iconcache import PixmapCache
+
+class ChannelListModel(QAbstractListModel):
+    ChannelRole = Qt.UserRole + 1
+
+    def __init__(self, deleted_channels, parent=None):
+        super().__init__(parent)
+        self.deleted_channels = deleted_channels
+        self.channels = []
+        self.rows = {}  # channel id -> row
+        self.icon_size = QSize(16, 16)
+        self.device_pixel_ratio = 1.0
+        self.pixmap_cache = PixmapCache()  # filled on first paint of a row
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.channels)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        channel = self.channels[index.row()]
+        if role == Qt.DisplayRole:
+            return channel.name
+        elif role == Qt.DecorationRole:
+            return self.pixmap_cache.pixmap(channel, self.icon_size, self.device_pixel_ratio)
+        elif role == Qt.ForegroundRole:
+            if channel.id in self.deleted_channels:
+                return QBrush(QColor(255, 0, 0))
+        elif role == ChannelListModel.ChannelRole:
+            return channel
+        return None
+
+    def setIconSize(self, size, device_pixel_ratio=1.0):
+        if size != self.icon_size or device_pixel_ratio != self.device_pixel_ratio:
+            self.icon_size = size
+            self.device_pixel_ratio = device_pixel_ratio
+            self.pixmap_cache.clear()
+
+    def addChannels(self, channels):
+        new_channels = {}
+        for channel in channels:
+            self.removeUnsupportedStreams(channel)
+            if len(channel.streamurls) == 0:
+                continue
+
+            if channel.id in self.rows:
+                self.updateChannel(channel)
+            else:
+                new_channels[channel.id] = channel
+
+        if new_channels:
+            first_row = len(self.channels)
+            self.beginInsertRows(QModelIndex(), first_row, first_row + len(new_channels) - 1)
+            for row, channel in enumerate(new_channels.values(), first_row):
+                self.channels.append(channel)
+                self.rows[channel.id] = row
+            self.endInsertRows()
+
+    def updateChannels(self, channels):
+        # Channels that lost all of their playable streams are dropped,
+        # ones the model hasn't seen are added
+        self.addChannels(channels)
+        self.removeChannels([channel for channel in channels if len(channel.streamurls) == 0])
+
+    def updateChannel(self, channel):
+        row = self.rows[channel.id]
+        self.channels[row] = channel
+        self.pixmap_cache.invalidate(channel.id)
+        self.channelChanged(channel)
+
+    def channelChanged(self, channel):
+        row = self.rows.get(channel.id, None)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def removeChannel(self, channel):
+        self.removeChannels([channel])
+
+    def removeChannels(self, channels):
+        # Runs of adjacent rows are removed bottom up, so rows not yet
+        # removed keep their index, and the id -> row map is rebuilt once
+        rows = sorted({self.rows[channel.id] for channel in channels if channel.id in self.rows}, reverse=True)
+        if not rows:
+            return
+
+        last = first = rows[0]
+        for row in rows[1:] + [None]:
+            if row == first - 1:
+                first = row
+                continue
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for channel in self.channels[first:last + 1]:
+                self.pixmap_cache.invalidate(channel.id)
+            del self.channels[first:last + 1]
+            self.endRemoveRows()
+            last = first = row
+        self.rows = {channel.id: row for row, channel in enumerate(self.channels)}
+
+    def clear(self):
+        self.beginResetModel()
+        self.channels = []
+        self.rows = {}
+        self.pixmap_cache.clear()
+        self.endResetModel()
+
+    def channelExists(self, channel):
+        return channel.id in self.rows
+
+    def removeUnsupportedStreams(self, channel):
+        protocol_plugins = QApplication.instance().protocol_plugins
+        channel.streamurls[:] = [
+            streamurl for streamurl in channel.streamurls
+            if protocol_plugins.get(urlparse(streamurl).scheme, None)
+        ]
+
+
+class ChannelFilterProxyModel(QSortFilterProxyModel):
+    def __init__(self, deleted_channels, parent=None):
+        super().__init__(parent)
+        self.deleted_channels = deleted_channels
+        self.show_deleted = False
+        self.chlist_filter = None
+        self.setDynamicSortFilter(True)
+
+    def setShowDeleted(self, show_deleted):
+        self.show_deleted = show_deleted
+        self.invalidateFilter()
+
+    def setChannelListFilter(self, chlist):
+        self.chlist_filter = chlist
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        channel = self.sourceModel().channels[source_row]
+        if channel.id in self.deleted_channels and not self.show_deleted:
+            return False
+        if self.chlist_filter:
+            return channel.origin == self.chlist_filter.origin_url
+        return True
@@ -1,83 +1,92 @@
-from PyQt5.QtWidgets import QListWidget, QMenu, QApplication
-from PyQt5.QtCore import Qt, pyqtSignal
-from PyQt5.QtGui import QBrush, QColor
-from channelitem import ChannelItem
+from PyQt5.QtWidgets import QListView, QMenu, QApplication, QStyle
+from PyQt5.QtCore import Qt, QSize, pyqtSignal
 
 from models.channel import Channel
 from channellistmanager import ChannelListManager
+from channellistmodel import ChannelListModel, ChannelFilterProxyModel
 from channelinfo import ChannelInfoDialog
 from epg import EPGDialog
 from txicon import TXIcon
 
-class ChannelListWidget(QListWidget):
-    deleted_channels = QApplication.instance().settings_manager.value("channels/deleted", []) or []  # https://riverbankcomputing.com/pipermail/pyqt/2011-September/030480.html
-    _show_deleted = False
-    _chlist_filter = None
+class ChannelListWidget(QListView):
+    deleted_channels = set(QApplication.instance().settings_manager.value("channels/deleted", []) or [])  # https://riverbankcomputing.com/pipermail/pyqt/2011-September/030480.html
     channelActivated = pyqtSignal(Channel, int)
+    recordRequested = pyqtSignal(Channel)
+    recordingScheduled = pyqtSignal('PyQt_PyObject', float, float, str)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.setUniformItemSizes(True)
+        self.channel_model = ChannelListModel(ChannelListWidget.deleted_channels, self)
+        self.proxy_model = ChannelFilterProxyModel(ChannelListWidget.deleted_channels, self)
+        self.proxy_model.setSourceModel(self.channel_model)
+        self.proxy_model.sort(0, Qt.AscendingOrder)
+        self.setModel(self.proxy_model)
+        self.updateModelIconSize()
         QApplication.instance().aboutToQuit.connect(self.aboutToQuit)
-        self.itemActivated.connect(self.channelItemActivated)
+        self.activated.connect(self.channelIndexActivated)
 
     @property
     def show_deleted(self):
-        return self._show_deleted
+        return self.proxy_model.show_deleted
 
     @show_deleted.setter
     def show_deleted(self, show_deleted):
-        self._show_deleted = show_deleted
-        self.refresh()
-    
-    def refresh(self):
-        for item in self.iterAllItems():
-            self.setChannelItemVisibility(item)
+        self.proxy_model.setShowDeleted(show_deleted)
 
     def addChannel(self, channel):
-        if len(channel.streamurls) != 0:
-            existing_item = self.channelItemForChannel(channel)
-            if not existing_item:
-                channel_item = ChannelItem(channel)
-                self.addItem(channel_item)
-                self.setChannelItemVisibility(channel_item)
-            else:
-                existing_item.channel = channel
-                
+        self.channel_model.addChannels([channel])
+
+    def addChannels(self, channels):
+        self.channel_model.addChannels(channels)
+
+    def updateChannels(self, channels):
+        self.channel_model.updateChannels(channels)
+
     def showChannelList(self, chlist):
-        self._chlist_filter = chlist
-        self.refresh()
+        self.proxy_model.setChannelListFilter(chlist)
 
     def showAllChannelLists(self):
-        self._chlist_filter = None
-        self.refresh()
+        self.proxy_model.setChannelListFilter(None)
 
-    def channelItemForChannel(self, channel):
-        for channel_item in self.iterAllItems():
-            if channel_item.channel == channel:
-                return channel_item
-        return None
+    def removeChannel(self, channel):
+        self.channel_model.removeChannel(channel)
 
-    def channelExists(self, channel):
-        for channelitem in self.iterAllItems():
-            if channelitem.channel == channel:
-                return True
-        return False
+    def removeChannels(self, channels):
+        self.channel_model.removeChannels(channels)
 
-    def iterAllItems(self):
-        for i in range(self.count()):
-            yield self.item(i)
+    def clear(self):
+        self.channel_model.clear()
+
+    def channelExists(self, channel):
+        return self.channel_model.channelExists(channel)
+
+    def channelForIndex(self, index):
+        return self.proxy_model.data(index, ChannelListModel.ChannelRole)
+
+    def neighbourChannels(self, channel, distance=1):
+        # Channels listed right after and before channel, nearest first
+        row = self.channel_model.rows.get(channel.id, None)
+        if row is None:
+            return []
+        proxy_row = self.proxy_model.mapFromSource(self.channel_model.index(row, 0)).row()
+        if proxy_row < 0:
+            return []
+
+        channels = []
+        for offset in range(1, distance + 1):
+            for neighbour_row in [proxy_row + offset, proxy_row - offset]:
+                if 0 <= neighbour_row < self.proxy_model.rowCount():
+                    channels.append(self.channelForIndex(self.proxy_model.index(neighbour_row, 0)))
+        return channels
 
     def deleteChannel(self, channel):
-        ChannelListWidget.deleted_channels.append(channel.id)
-        self.setChannelItemVisibility(self.channelItemForChannel(channel))
+        ChannelListWidget.deleted_channels.add(channel.id)
+        self.channel_model.channelChanged(channel)
 
     def undeleteChannel(self, channel):
-        ChannelListWidget.deleted_channels.remove(channel.id)
-        channel_item = self.channelItemForChannel(channel)
-        brush = ChannelItem(None).foreground()
-        channel_item.setForeground(brush)
-        channel_item.setHidden(False)
-        self.setChannelItemVisibility(self.channelItemForChannel(channel))
+        ChannelListWidget.deleted_channels.discard(channel.id)
+        self.channel_model.channelChanged(channel)
 
     def showChannelInfo(self, channel):
         channel_info_dialog = ChannelInfoDialog(channel, self.window())
@@ -85,46 +94,41 @@ class ChannelListWidget(QListWidget):
 
     def showChannelEPG(self, channel):
         channel_epg_dialog = EPGDialog(channel, self.window())
+        channel_epg_dialog.record_requested.connect(self.recordingScheduled)
         channel_epg_dialog.exec()
 
-    def setChannelItemVisibility(self, channel_item):
-        if channel_item.channel.id in ChannelListWidget.deleted_channels:
-            if self.show_deleted:
-                if self._chlist_filter:
-                    channel_item.setHidden(channel_item.channel.origin != self._chlist_filter.origin_url)
-                else:
-                    channel_item.setHidden(False)
-                brush = channel_item.foreground()
-                color = brush.color()
-                color.setRed(255)
-                brush.setColor(color)
-                channel_item.setForeground(brush)
-            else:
-                channel_item.setHidden(True)
-        else:
-            if self._chlist_filter:
-                channel_item.setHidden(channel_item.channel.origin != self._chlist_filter.origin_url)
-            else:
-                channel_item.setHidden(False)
+    def updateModelIconSize(self):
+        size = self.iconSize()
+        if not size.isValid():
+            extent = self.style().pixelMetric(QStyle.PM_SmallIconSize, None, self)
+            size = QSize(extent, extent)
+        self.channel_model.setIconSize(size, self.devicePixelRatioF())
+
+    def setIconSize(self, size):
+        super().setIconSize(size)
+        self.updateModelIconSize()
 
-    def channelItemActivated(self, channel_item):
-        self.channelActivated.emit(channel_item.channel, 0)
+    def channelIndexActivated(self, index):
+        self.channelActivated.emit(self.channelForIndex(index), 0)
 
     def aboutToQuit(self):
-        QApplication.instance().settings_manager.setValue("channels/deleted", ChannelListWidget.deleted_channels)
+        QApplication.instance().settings_manager.setValue("channels/deleted", list(ChannelListWidget.deleted_channels))
         QApplication.instance().settings_manager.sync()
 
     # Events
     def contextMenuEvent(self, event):
-        current_item = self.currentItem()
+        current_index = self.currentIndex()
+        if not current_index.isValid():
+            return
+        channel = self.channelForIndex(current_index)
         play_menu_actions = []
 
         menu = QMenu(self)
         play_action = menu.addAction(TXIcon('icons/play-button.svg'), self.tr("Play"))
-        if len(current_item.channel.streamurls) > 1:
+        if len(channel.streamurls) > 1:
             play_action.setVisible(False)
             play_menu = menu.addMenu(TXIcon('icons/play-button.svg'), self.tr("Play"))
-            for streamurl in current_item.channel.streamurls:
+            for streamurl in channel.streamurls:
                 play_menu_actions.append(play_menu.addAction(streamurl))
         record_action = menu.addAction(TXIcon('icons/record-button.svg'), self.tr("Record"))
         menu.addSeparator()
@@ -133,21 +137,23 @@ class ChannelListWidget(QListWidget):
         menu.addSeparator()
         delete_action = menu.addAction(TXIcon('icons/trash.svg'), self.tr("Delete channel"))
         undelete_action = menu.addAction(TXIcon('icons/untrash.svg'), self.tr("Undelete channel"))
-        if current_item.channel.id not in self.deleted_channels:
+        if channel.id not in self.deleted_channels:
             undelete_action.setVisible(False)
         else:
             delete_action.setVisible(False)
         action = menu.exec_(self.mapToGlobal(event.pos()))
 
         if action in play_menu_actions:
-            self.channelActivated.emit(current_item.channel, play_menu_actions.index(action))
+            self.channelActivated.emit(channel, play_menu_actions.index(action))
         elif action == play_action:
-            self.channelActivated.emit(current_item.channel, 0)
+            self.channelActivated.emit(channel, 0)
         elif action == delete_action:
-            self.deleteChannel(current_item.channel)
+            self.deleteChannel(channel)
         elif action == undelete_action:
-            self.undeleteChannel(current_item.channel)
+            self.undeleteChannel(channel)
         elif action == info_action:
-            self.showChannelInfo(current_item.channel)
+            self.showChannelInfo(channel)
+        elif action == record_action:
+            self.recordRequested.emit(channel)
         elif action == epg_action:
-            self.showChannelEPG(current_item.channel)
+            self.showChannelEPG(channel)
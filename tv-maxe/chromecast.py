@@ -1,68 +1,72 @@
 import pychromecast
 import logging
 import socket
-import threading
+import asyncio
 import subprocess
 import signal
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import urlparse, parse_qs, quote_plus
+from urllib.parse import quote_plus
+from PyQt5.QtWidgets import QApplication
 from PyQt5.QtCore import Qt, QObject, QMetaObject, QThread, pyqtSignal, pyqtSlot, Q_ARG
 from pychromecast.controllers.media import *
 
-from util import get_open_port
+from relay import StreamRelay, RELAY_CAPACITY
 
 log = logging.getLogger(__name__)
-BUF_SIZE = 64 * 1024
 
-class RequestHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(200)
-        self.send_header("Content-Type", "image/jpeg")
-        self.end_headers()
+class CastServer:
+    # Endpoints the Chromecast loads media from; they are public since the
+    # device connects from the local network
+    def __init__(self, stream_server, relay_capacity=RELAY_CAPACITY):
+        self.stream_server = stream_server
+        self.relay_capacity = relay_capacity
+        self.ffmpeg_process = None
+        self.port = None
 
-        if self.path == '/splash.jpg':
-            fh = open('images/open-source.jpg', 'rb')
-            data = fh.read()
-            fh.close()
-            self.wfile.write(data)
-            return
-        elif self.path.startswith('/broadcast'):
-            query_dict = parse_qs(urlparse(self.path).query)
-            url = query_dict['url'][0]
-
-            cmd = ["ffmpeg", "-i", url, "-preset", "ultrafast", "-frag_duration", "3000", "-max_muxing_queue_size", "9999", "-nostats", "-loglevel", "0", "-f", "mp4", "-"]
-            log.debug("Executing {0}".format(" ".join(cmd)))
-            self.server.ffmpeg_process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.DEVNULL
-            )
-
-            while self.server.ffmpeg_process and self.server.ffmpeg_process.poll() is None:
-                stdout_data = self.server.ffmpeg_process.stdout.read(BUF_SIZE)
-                self.wfile.write(stdout_data)
-
-            log.debug("FFMPEG is dead, closing server...")
-            self.server.ffmpeg_process = None
-            self.server.socket.close()
-            return
-
-
-class CastServer(QObject):
     def start_server(self):
         log.debug('Configuring Chromecast server')
-        self.httpd = HTTPServer(self.server_address, RequestHandler)
-        self.httpd.ffmpeg_process = None
-        threading.Thread(target=self.httpd.serve_forever).start()
-        log.debug("Started Chromecast server at {0}".format(self.server_address))
+        self.stream_server.add_endpoint('/splash.jpg', self.splash, public=True)
+        self.stream_server.add_endpoint('/broadcast', self.broadcast, public=True)
+        self.port = self.stream_server.listen('0.0.0.0')
+        log.debug("Started Chromecast server on port {0}".format(self.port))
+
+    async def splash(self, request, response):
+        with open('images/open-source.jpg', 'rb') as fh:
+            data = fh.read()
+        await response.send_headers(200, {"Content-Type": "image/jpeg", "Content-Length": len(data)})
+        await response.write(data)
+
+    async def broadcast(self, request, response):
+        url = request.query['url'][0]
+        cmd = ["ffmpeg", "-i", url, "-preset", "ultrafast", "-frag_duration", "3000", "-max_muxing_queue_size", "9999", "-nostats", "-loglevel", "0", "-f", "mp4", "-"]
+        log.debug("Executing {0}".format(" ".join(cmd)))
+        await asyncio.get_event_loop().run_in_executor(None, self.stop_ffmpeg)
+        ffmpeg_process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self.ffmpeg_process = ffmpeg_process
+
+        relay = StreamRelay(ffmpeg_process.stdout, self.relay_capacity)
+        relay.start()
+        try:
+            await relay.endpoint("video/mp4")(request, response)
+        finally:
+            relay.stop()
+            log.debug("Cast relay: {0}".format(relay.metrics()))
+            if self.ffmpeg_process is ffmpeg_process:
+                await asyncio.get_event_loop().run_in_executor(None, self.stop_ffmpeg)
+
+    def stop_ffmpeg(self):
+        ffmpeg_process, self.ffmpeg_process = self.ffmpeg_process, None
+        if ffmpeg_process and ffmpeg_process.poll() is None:
+            ffmpeg_process.send_signal(signal.SIGINT)
+            ffmpeg_process.wait()
+            log.debug("FFMPEG stopped")
 
-    @pyqtSlot()
     def stop_server(self):
         log.debug("Stopping Chromecast server...")
-        if self.httpd.ffmpeg_process:
-            self.httpd.ffmpeg_process.send_signal(signal.SIGINT)
-            self.httpd.ffmpeg_process.wait()
-            self.httpd.ffmpeg_process = None
+        self.stop_ffmpeg()
 
 class CastManager(QObject):
     devices_found = pyqtSignal(list)
@@ -72,6 +76,8 @@ class CastManager(QObject):
         super().__init__(*args, **kwargs)
         self.device = None
         self.cast_server = None
+        self.stream_server = None
+        self.relay_capacity = RELAY_CAPACITY
 
     @pyqtSlot()
     def search_devices(self):
@@ -83,12 +89,9 @@ class CastManager(QObject):
     def connect_to_device(self, device):
         self.device = device
 
-        server_thread = QThread(self)
-        self.cast_server = CastServer()
-        self.cast_server.server_address = ('0.0.0.0', get_open_port())
-        self.cast_server.moveToThread(server_thread)
-        server_thread.started.connect(self.cast_server.start_server)
-        server_thread.start()
+        if not self.cast_server:
+            self.cast_server = CastServer(self.stream_server, self.relay_capacity)
+            self.cast_server.start_server()
 
         self.device_connected.emit(device)
 
@@ -96,7 +99,7 @@ class CastManager(QObject):
     def play_media_path(self, path, content_type):
         media_url = 'http://{0}:{1}{2}'.format(
             socket.gethostbyname(socket.getfqdn()),
-            self.cast_server.server_address[1],
+            self.cast_server.port,
             path)
         self.device.media_controller.play_media(media_url, content_type)
 
@@ -115,11 +118,7 @@ class CastManager(QObject):
     @pyqtSlot()
     def stop_media_playback(self):
         self.device.media_controller.stop()
-        QMetaObject.invokeMethod(
-            self.cast_server,
-            'stop_server', 
-            Qt.AutoConnection
-        )
+        self.cast_server.stop_server()
 
 class Chromecast(QObject):
     devices_found = pyqtSignal(list)
@@ -135,6 +134,10 @@ class Chromecast(QObject):
         self.current_device = None
 
         self.cast_manager = CastManager()
+        self.cast_manager.stream_server = QApplication.instance().stream_server
+        self.cast_manager.relay_capacity = QApplication.instance().settings_manager.value(
+            "relay/buffer_size", RELAY_CAPACITY, int
+        )
         self.cast_manager.devices_found.connect(self.devices_found_)
         self.cast_manager.device_connected.connect(self.device_connected_)
         worker_thread = QThread(self)
@@ -1,22 +1,23 @@
 import datetime
 import logging
 import json
-import os
-import sqlite3
-import itertools
+from functools import partial
 from PyQt5 import uic
-from PyQt5.QtWidgets import QDialog, QAbstractItemView, QMessageBox
-from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkRequest, QNetworkReply
-from PyQt5.QtGui import QImage, QPixmap, QStandardItemModel, QStandardItem
+from PyQt5.QtWidgets import QApplication, QDialog, QAbstractItemView, QMessageBox, QMenu
+from PyQt5.QtNetwork import QNetworkRequest, QNetworkReply
+from PyQt5.QtGui import QStandardItemModel, QStandardItem
 from PyQt5.QtCore import QUrl, Qt, QObject, QItemSelectionModel, pyqtSignal
 
-import paths
-from util import toLocalTime
-from channellistmanager import ChannelListManager
+from epgschedule import EPGSchedule
+from epgcache import EPGCache
+from models.channellist import ChannelList
+from iconcache import ThumbnailCache
 
 log = logging.getLogger(__name__)
 
 class EPGDialog(QDialog):
+    record_requested = pyqtSignal('PyQt_PyObject', float, float, str)
+
     def __init__(self, channel, parent=None):
         super(QDialog, self).__init__(parent)
         uic.loadUi('ui/epg.ui', self)
@@ -25,14 +26,8 @@ class EPGDialog(QDialog):
 
         self.setWindowTitle(self.tr("TV Guide for {0}").format(channel.name))
         self.channel_name_label.setText(channel.name)
-        image = QImage()
-        image.loadFromData(channel.icon)
         self.icon_label.setPixmap(
-            QPixmap.fromImage(image).scaled(
-                self.icon_label.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
+            ThumbnailCache.pixmap(channel.icon, self.icon_label.size(), self.devicePixelRatioF())
         )
 
         combobox_model = QStandardItemModel(0, 2)
@@ -45,6 +40,9 @@ class EPGDialog(QDialog):
         treeview_model = QStandardItemModel(0, 2)
         self.epg_treeview.setModel(treeview_model)
         self.epg_treeview.setColumnWidth(0, 80)
+        self.epg_treeview.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.epg_treeview.customContextMenuRequested.connect(self.show_context_menu)
+        self.schedule = None
 
         self.progress_bar.setMinimum(0)
         self.progress_bar.setMaximum(0)
@@ -56,7 +54,7 @@ class EPGDialog(QDialog):
                 [QStandardItem(day.strftime("%Y-%m-%d")), QStandardItem(day.strftime("%A, %x").capitalize())]
             )
 
-        self.access_manager = None
+        self.epg_retriever = None
         self.day_activated(0)
 
     def day_activated(self, index):
@@ -64,6 +62,8 @@ class EPGDialog(QDialog):
         self.epg_treeview.setHeaderHidden(True)
         self.epg_treeview.model().clear()
 
+        if self.epg_retriever:
+            self.epg_retriever.cancel()
         self.epg_retriever = EPGRetriever(self.channel, self.days_combobox.model().item(index, 0).text())
         self.epg_retriever.epg_data_available.connect(self.display_epg)
         self.epg_retriever.epg_data_error.connect(self.epg_data_error)
@@ -71,17 +71,18 @@ class EPGDialog(QDialog):
 
     def display_epg(self, epg_list):
         self.progress_bar.hide()
-        hours = [toLocalTime(x[0]) for x in epg_list]
-        now = datetime.datetime.strptime(datetime.datetime.now().strftime("%H:%M"), "%H:%M")
-        current = [x for x in itertools.takewhile(lambda t: now >= datetime.datetime.strptime(t, "%H:%M"), hours)][-1]
+        date_str = self.days_combobox.model().item(self.days_combobox.currentIndex(), 0).text()
+        schedule = self.schedule = EPGSchedule(epg_list, date_str)
+        current = -1
+        if date_str == datetime.datetime.now().strftime("%Y-%m-%d"):
+            current = schedule.index_at()
 
-        for idx, epg_line in enumerate(epg_list):
+        for idx in range(len(schedule)):
             row = [
-                QStandardItem(toLocalTime(epg_line[0])), QStandardItem(epg_line[1])
+                QStandardItem(schedule.local_time(idx)), QStandardItem(schedule.titles[idx])
             ]
             self.epg_treeview.model().appendRow(row)
-            if toLocalTime(epg_line[0]) == current and \
-              self.days_combobox.model().item(self.days_combobox.currentIndex(), 0).text() == datetime.datetime.now().strftime("%Y-%m-%d"):
+            if idx == current:
                 selection = self.epg_treeview.selectionModel()
                 selection.select(self.epg_treeview.model().index(idx, 0), QItemSelectionModel.ClearAndSelect | QItemSelectionModel.Rows)
 
@@ -89,6 +90,29 @@ class EPGDialog(QDialog):
         self.epg_treeview.setHeaderHidden(False)
         self.epg_treeview.resizeColumnToContents(0)
 
+    def show_context_menu(self, pos):
+        index = self.epg_treeview.indexAt(pos)
+        row = index.row()
+        if not index.isValid() or not self.schedule or row >= len(self.schedule):
+            return
+
+        start = self.schedule.starts[row]
+        if row + 1 < len(self.schedule):
+            end = self.schedule.starts[row + 1]
+        else:
+            end = start + 3600  # the guide doesn't say when the last show ends
+
+        menu = QMenu(self)
+        record_action = menu.addAction(self.tr("Record"))
+        record_action.setEnabled(end > datetime.datetime.now().timestamp())
+        if menu.exec_(self.epg_treeview.viewport().mapToGlobal(pos)) == record_action:
+            self.record_requested.emit(self.channel, start, end, self.schedule.titles[row])
+
+    def done(self, result):
+        if self.epg_retriever:
+            self.epg_retriever.cancel()
+        super().done(result)
+
     def epg_data_error(self, error_msg):
         self.progress_bar.hide()
         QMessageBox.critical(
@@ -102,43 +126,96 @@ class EPGRetriever(QObject):
     epg_data_available = pyqtSignal(list)
     epg_data_error = pyqtSignal(str)
 
+    # (channel id, date) -> [NetworkJob, callbacks waiting for it]; concurrent
+    # requests for the same guide share a single reply
+    in_flight = {}
+
     def __init__(self, channel, date_str, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.channel = channel
         self.date_str = date_str
-
-        self.origin_chlist = None
-        for chlist in ChannelListManager.channellists:
-            if chlist.origin_url == channel.origin:
-                self.origin_chlist = chlist
-                break
-
-        self.access_manager = QNetworkAccessManager(self)
-        self.access_manager.finished.connect(self.handle_response)
+        self.pending = None
+
+        self.origin_chlist = ChannelList.loaded.get(channel.origin)
+
+    @staticmethod
+    def guide_url(epg_url, channel_id, date_str):
+        return "{0}?action=getGuide&channel={1}&date={2}".format(epg_url, channel_id, date_str)
+
+    @staticmethod
+    def fetch(epg_url, channel_id, date_str, callback, low_priority=False):
+        key = (channel_id, date_str)
+        network = QApplication.instance().network
+        if key in EPGRetriever.in_flight:
+            job, callbacks = EPGRetriever.in_flight[key]
+            callbacks.append(callback)
+            if not low_priority:
+                network.promote(job)
+            log.debug('Joined in-flight EPG request for {0} on {1}'.format(channel_id, date_str))
+            return key
+
+        request = QNetworkRequest(QUrl(EPGRetriever.guide_url(epg_url, channel_id, date_str)))
+        job = network.get(request, low_priority)
+        EPGRetriever.in_flight[key] = [job, [callback]]
+        job.finished.connect(partial(EPGRetriever.fetch_finished, key))
+        return key
+
+    @staticmethod
+    def fetch_finished(key, job):
+        entry = EPGRetriever.in_flight.get(key, None)
+        if not entry or entry[0] is not job:
+            return
+        del EPGRetriever.in_flight[key]
+
+        json_data = None
+        if job.error() == QNetworkReply.NoError:
+            json_data = bytes(job.readAll())
+            try:
+                json.loads(json_data.decode("utf-8"))
+                EPGCache.put(key[0], key[1], json_data)
+            except (UnicodeDecodeError, ValueError):
+                pass  # reported by whoever decodes it
+
+        for callback in entry[1]:
+            callback(job, json_data)
+
+    @staticmethod
+    def release(key, callback):
+        # Drops interest in a request; the last one out aborts it
+        entry = EPGRetriever.in_flight.get(key, None)
+        if entry and callback in entry[1]:
+            entry[1].remove(callback)
+            if not entry[1]:
+                del EPGRetriever.in_flight[key]
+                log.debug('Aborting superseded EPG request for {0} on {1}'.format(*key))
+                entry[0].abort()
 
     def retrieve_epg(self):
+        self.cancel()
         if self.origin_chlist:
-            url = "{0}?action=getGuide&channel={1}&date={2}".format(
-                self.origin_chlist.epg_url,
-                self.channel.id,
-                self.date_str
-            )            
-
             cached_json = self.epg_from_cache(self.channel.id, self.date_str)
             if cached_json:
                 log.debug("Found EPG in cache for {0}".format(self.date_str))
                 self.process_data(cached_json)
             else:
-                log.debug('Retrieving EPG data from {0}'.format(url))
-                request = QNetworkRequest(QUrl(url))
-                self.access_manager.get(request)
-
-    def handle_response(self, response):
+                log.debug('Retrieving EPG data for {0} on {1}'.format(self.channel.id, self.date_str))
+                self.pending = EPGRetriever.fetch(
+                    self.origin_chlist.epg_url,
+                    self.channel.id,
+                    self.date_str,
+                    self.handle_response
+                )
+
+    def cancel(self):
+        if self.pending:
+            EPGRetriever.release(self.pending, self.handle_response)
+            self.pending = None
+
+    def handle_response(self, response, json_data):
+        self.pending = None
         if response.error() == QNetworkReply.NoError:
             log.debug('Retrieved EPG for {0}'.format(self.channel.name))
-            json_data = bytes(response.readAll())
-            self.cache_epg(self.channel.id, self.date_str, json_data)
             self.process_data(json_data)
         elif response.error() == QNetworkReply.ContentNotFoundError:
             self.epg_data_error.emit("EPG data is not available for this channel.")
@@ -155,37 +232,5 @@ class EPGRetriever(QObject):
 
         self.epg_data_available.emit(epg_list)
 
-    def cache_epg(self, channel_id, date_str, json_data):
-        if not os.path.exists(paths.EPG_CACHE):
-            conn = sqlite3.connect(paths.EPG_CACHE)
-            c = conn.cursor()
-            c.execute("CREATE TABLE epg_cache (channel_id text, date_str text, json_data blob)")
-            conn.commit()
-            conn.close()
-
-        conn = sqlite3.connect(paths.EPG_CACHE)
-        c = conn.cursor()
-        c.execute(
-            "INSERT INTO epg_cache (channel_id, date_str, json_data) VALUES (:channel_id, :date_str, :json_data)",
-            {
-                "channel_id": channel_id,
-                "date_str": date_str,
-                "json_data": json_data
-            }
-        )
-        conn.commit()
-        conn.close()
-
     def epg_from_cache(self, channel_id, date_str):
-        if not os.path.exists(paths.EPG_CACHE):
-            return None
-
-        conn = sqlite3.connect(paths.EPG_CACHE)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-        c.execute("SELECT * FROM epg_cache WHERE channel_id=? AND date_str=?", (channel_id, date_str))
-        row = c.fetchone()
-        conn.close()
-        if row:
-            return row['json_data']
-        return None
+        return EPGCache.get(channel_id, date_str)
\ No newline at end of file
@@ -0,0 +1,99 @@
+import time
+import datetime
+import logging
+
+import paths
+from models.database import Database
+
+log = logging.getLogger(__name__)
+SCHEMA_VERSION = 1
+EPG_TTL = 6 * 60 * 60  # guides for today and later days may still be corrected upstream
+PRUNE_INTERVAL = 24 * 60 * 60
+
+class EPGCache:
+    _db = None
+
+    @staticmethod
+    def db():
+        if not EPGCache._db:
+            EPGCache._db = Database(paths.EPG_CACHE)
+            EPGCache.migrate(EPGCache._db)
+            EPGCache.prune_if_due()
+        return EPGCache._db
+
+    @staticmethod
+    def migrate(db):
+        version = db.fetchone("PRAGMA user_version")[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        log.debug('Upgrading EPG cache schema from version {0} to {1}'.format(version, SCHEMA_VERSION))
+        with db.connection as conn:
+            legacy = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='epg_cache'"
+            ).fetchone()
+            if legacy:
+                conn.execute("ALTER TABLE epg_cache RENAME TO epg_cache_v0")
+
+            conn.execute("""CREATE TABLE epg_cache (
+                                channel_id text NOT NULL,
+                                date_str text NOT NULL,
+                                json_data blob,
+                                fetched_at real NOT NULL,
+                                PRIMARY KEY (channel_id, date_str)
+                            ) WITHOUT ROWID""")
+            conn.execute("CREATE TABLE IF NOT EXISTS epg_meta (key text PRIMARY KEY, value text)")
+
+            if legacy:
+                # Later duplicates win; fetched_at 0 marks them as expired
+                conn.execute("""INSERT OR REPLACE INTO epg_cache (channel_id, date_str, json_data, fetched_at)
+                                SELECT channel_id, date_str, json_data, 0 FROM epg_cache_v0 ORDER BY rowid""")
+                conn.execute("DROP TABLE epg_cache_v0")
+            conn.execute("PRAGMA user_version = {0}".format(SCHEMA_VERSION))
+
+    @staticmethod
+    def get(channel_id, date_str):
+        row = EPGCache.db().fetchone(
+            "SELECT json_data, fetched_at FROM epg_cache WHERE channel_id=? AND date_str=?",
+            (channel_id, date_str)
+        )
+        if not row:
+            return None
+        if EPGCache.is_expired(date_str, row['fetched_at']):
+            log.debug('EPG cache entry expired for {0} on {1}'.format(channel_id, date_str))
+            return None
+        return row['json_data']
+
+    @staticmethod
+    def is_expired(date_str, fetched_at):
+        if date_str < datetime.date.today().strftime("%Y-%m-%d"):
+            return False
+        return time.time() - fetched_at > EPG_TTL
+
+    @staticmethod
+    def put(channel_id, date_str, json_data):
+        EPGCache.db().execute(
+            "INSERT OR REPLACE INTO epg_cache (channel_id, date_str, json_data, fetched_at) VALUES (?, ?, ?, ?)",
+            (channel_id, date_str, json_data, time.time())
+        )
+
+    @staticmethod
+    def prune_if_due():
+        row = EPGCache._db.fetchone("SELECT value FROM epg_meta WHERE key='last_prune'")
+        if row and time.time() - float(row['value']) < PRUNE_INTERVAL:
+            return
+        EPGCache.prune()
+
+    @staticmethod
+    def prune():
+        db = EPGCache._db
+        today = datetime.date.today().strftime("%Y-%m-%d")
+        with db.connection as conn:
+            deleted = conn.execute("DELETE FROM epg_cache WHERE date_str < ?", (today, )).rowcount
+            conn.execute(
+                "INSERT OR REPLACE INTO epg_meta (key, value) VALUES ('last_prune', ?)",
+                (str(time.time()), )
+            )
+        log.debug('Pruned {0} past EPG entries'.format(deleted))
+        if deleted:
+            db.connection.execute("VACUUM")
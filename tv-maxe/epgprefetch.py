@@ -0,0 +1,76 @@
+import datetime
+import logging
+from functools import partial
+from collections import deque
+from PyQt5.QtNetwork import QNetworkReply
+from PyQt5.QtCore import QObject
+from PyQt5.QtWidgets import QApplication
+
+from epg import EPGRetriever
+from epgcache import EPGCache
+
+log = logging.getLogger(__name__)
+
+class EPGPrefetcher(QObject):
+    # Fills the EPG cache in the background for every channel of the lists
+    # that provide a guide, so opening a guide doesn't wait on the network
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        settings = QApplication.instance().settings_manager
+        self.days = settings.value("epg/prefetch_days", 3, int)
+        self.max_requests = settings.value("epg/prefetch_requests", 4, int)
+
+        self.queue = deque()
+        self.queued = set()  # (channel id, date) pairs waiting or in flight
+        self.requests = 0
+
+    def prefetch_chlist(self, chlist):
+        if self.days <= 0 or not chlist.epg_url:
+            return
+
+        today = datetime.date.today()
+        dates = [(today + datetime.timedelta(n)).strftime("%Y-%m-%d") for n in range(self.days)]
+        channel_ids = chlist.channel_ids('tv')
+        queued = 0
+        for date_str in dates:
+            for channel_id in channel_ids:
+                key = (channel_id, date_str)
+                if key in self.queued or EPGCache.get(channel_id, date_str):
+                    continue
+                self.queued.add(key)
+                self.queue.append((chlist.epg_url, channel_id, date_str))
+                queued += 1
+
+        log.debug('Queued {0} EPG guides of {1} for prefetch'.format(queued, chlist.origin_url))
+        self.start_requests()
+
+    def start_requests(self):
+        while self.queue and self.requests < self.max_requests:
+            epg_url, channel_id, date_str = self.queue.popleft()
+            if EPGCache.get(channel_id, date_str):
+                self.queued.discard((channel_id, date_str))
+                continue  # fetched by an EPGRetriever in the meantime
+
+            EPGRetriever.fetch(
+                epg_url,
+                channel_id,
+                date_str,
+                partial(self.handle_response, channel_id, date_str),
+                low_priority=True
+            )
+            self.requests += 1
+
+    def handle_response(self, channel_id, date_str, response, json_data):
+        # Replies are stored in the cache by EPGRetriever.fetch_finished
+        self.requests -= 1
+        self.queued.discard((channel_id, date_str))
+
+        if response.error() not in [QNetworkReply.NoError, QNetworkReply.ContentNotFoundError]:
+            log.debug('Failed to prefetch EPG for {0} on {1}: {2}'.format(
+                channel_id, date_str, response.errorString()
+            ))
+
+        self.start_requests()
+
+        if not self.queue and not self.requests:
+            log.debug('EPG prefetch finished')
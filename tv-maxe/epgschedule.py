@@ -0,0 +1,89 @@
+import time
+import bisect
+import calendar
+import datetime
+
+class EPGSchedule:
+    # A day of EPG entries ([HH:MM (UTC), title] pairs, in airing order)
+    # parsed once into epoch timestamps. A start time lower than the one
+    # before it means the guide rolled over past midnight. This is the way to
+    # get a guide's local times: local_time() converts the whole time column
+    # in one pass, with the DST offset of each entry's own moment.
+    def __init__(self, epg_list, date_str):
+        self.date_str = date_str
+        self.titles = []
+        self.starts = []
+        self.local_times = None
+
+        day = calendar.timegm(datetime.datetime.strptime(date_str, "%Y-%m-%d").timetuple())
+        rollover = None
+        for epg_line in epg_list:
+            try:
+                hours, minutes = epg_line[0].split(':')
+                offset = int(hours) * 3600 + int(minutes) * 60
+            except (ValueError, AttributeError, IndexError):
+                continue
+            if rollover is None:
+                rollover = EPGSchedule.anchor(day, offset, date_str)
+            start = day + rollover + offset
+            if self.starts and start < self.starts[-1]:
+                rollover += 24 * 3600
+                start += 24 * 3600
+            self.starts.append(start)
+            self.titles.append(epg_line[1])
+
+    @staticmethod
+    def anchor(day, offset, date_str):
+        # A guide lists a local day in UTC times, so in UTC+ zones its first
+        # shows can fall on the previous UTC day (and in UTC- zones on the
+        # next one). Returns the shift that puts the first show on date_str.
+        for shift in [0, -24 * 3600, 24 * 3600]:
+            if time.strftime("%Y-%m-%d", time.localtime(day + shift + offset)) == date_str:
+                return shift
+        return 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def index_at(self, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        return bisect.bisect_right(self.starts, timestamp) - 1
+
+    def current(self, timestamp=None):
+        index = self.index_at(timestamp)
+        if index < 0:
+            return None
+        return self.entry(index)
+
+    def next(self, timestamp=None):
+        index = self.index_at(timestamp) + 1
+        if index >= len(self.starts):
+            return None
+        return self.entry(index)
+
+    def progress(self, timestamp=None):
+        # (elapsed, duration) in seconds for the show airing at timestamp
+        if timestamp is None:
+            timestamp = time.time()
+        index = self.index_at(timestamp)
+        if index < 0 or index + 1 >= len(self.starts):
+            return None
+        return (int(timestamp - self.starts[index]), self.starts[index + 1] - self.starts[index])
+
+    def next_boundary(self, timestamp=None):
+        # Epoch of the next programme change after timestamp, or None
+        index = self.index_at(timestamp) + 1
+        if index >= len(self.starts):
+            return None
+        return self.starts[index]
+
+    def entry(self, index):
+        return (self.starts[index], self.titles[index])
+
+    def local_time(self, index):
+        # Converted per entry from its own timestamp, so entries on either
+        # side of a DST switch or past midnight get their own offset
+        if self.local_times is None:
+            self.local_times = [time.strftime("%H:%M", time.localtime(start)) for start in self.starts]
+        return self.local_times[index]
@@ -1,12 +1,15 @@
+import time
 import datetime
-import itertools
+import logging
 from PyQt5 import uic
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtWidgets import QApplication, QWidget
 
 from txicon import TXIcon
 from epg import EPGRetriever
-from util import toLocalTime
+from epgschedule import EPGSchedule
+
+log = logging.getLogger(__name__)
 
 class FullscreenToolbar(QWidget):
     def __init__(self, parent=None, flags=0):
@@ -35,9 +38,20 @@ class FullscreenToolbar(QWidget):
         self.fullscreen_btn.clicked.connect(self.switch_fullscreen_mode)
         self.volume_slider.sliderMoved.connect(self.volume_changed)
 
-        self.timer = None
         self.epg = None
-        self.epg_list = []
+        self.epg_schedule = None
+        self.paint_count = 0
+        self.paint_time = 0.0
+
+        # The clock and the now-playing state are refreshed by their own
+        # timers, aligned to the next second and the next minute/programme
+        # boundary, so painting never has to recompute them
+        self.clock_timer = QTimer(self)
+        self.clock_timer.setSingleShot(True)
+        self.clock_timer.timeout.connect(self.update_clock)
+        self.epg_timer = QTimer(self)
+        self.epg_timer.setSingleShot(True)
+        self.epg_timer.timeout.connect(self.update_epg_state)
 
         # Set custom icons
         self.play_btn.setIcon(TXIcon('icons/play-button.svg', Qt.white))
@@ -49,16 +63,54 @@ class FullscreenToolbar(QWidget):
     def show(self):
         super().show()
         self.activateWindow()
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update)
-        self.timer.start(1000)
+        if not self.clock_timer.isActive():
+            self.update_clock()
+        if not self.epg_timer.isActive():
+            self.update_epg_state()
 
     def hide(self):
         super().hide()
-        if self.timer:
-            self.timer.stop()
-            self.timer.deleteLater()
-            self.timer = None
+        self.clock_timer.stop()
+        self.epg_timer.stop()
+        if self.paint_count:
+            log.debug('OSD painted {0} times, {1:.3f} ms per paint'.format(
+                self.paint_count,
+                self.paint_time * 1000 / self.paint_count
+            ))
+            self.paint_count = 0
+            self.paint_time = 0.0
+
+    def update_clock(self):
+        now = time.time()
+        self.clock_label.setText(datetime.datetime.fromtimestamp(now).strftime("%X"))
+        self.clock_timer.start(int((1 - now % 1) * 1000) + 1)
+
+    def update_epg_state(self):
+        now = time.time()
+        next_update = now - now % 60 + 60
+
+        current = self.epg_schedule.current(now) if self.epg_schedule else None
+        if current:
+            self.show_name_label.setText(current[1])
+            progress = self.epg_schedule.progress(now)
+            if progress:
+                elapsed, duration = progress
+                self.show_progress.setMinimum(0)
+                self.show_progress.setMaximum(duration)
+                self.show_progress.setValue(elapsed)
+                self.show_progress.show()
+            else:
+                self.show_progress.hide()
+
+            next_boundary = self.epg_schedule.next_boundary(now)
+            if next_boundary:
+                next_update = min(next_update, next_boundary)
+        else:
+            self.show_name_label.setText("")
+            self.show_progress.hide()
+
+        if self.isVisible():
+            self.epg_timer.start(int((next_update - now) * 1000) + 1)
 
     def play_btn_clicked(self, checked=False):
         from videoplayer import VideoPlayerState
@@ -80,13 +132,18 @@ class FullscreenToolbar(QWidget):
         self.parent().exit_fullscreen()
 
     def epg_data_available(self, epg_list):
-        self.epg_list = epg_list
+        self.epg_schedule = EPGSchedule(epg_list, self.epg.date_str)
+        self.update_epg_state()
 
     # Signals
 
     def video_playback_started(self, channel):
         self.play_btn.setIcon(TXIcon('icons/pause-button.svg', Qt.white))
         self.osd_channel_name.setText(channel.name)
+        self.epg_schedule = None
+        self.update_epg_state()
+        if self.epg:
+            self.epg.cancel()
         self.epg = EPGRetriever(channel, datetime.datetime.now().strftime("%Y-%m-%d"))
         self.epg.epg_data_available.connect(self.epg_data_available)
         self.epg.retrieve_epg()
@@ -106,32 +163,10 @@ class FullscreenToolbar(QWidget):
     # Qt Events
 
     def paintEvent(self, event):
+        start = time.perf_counter()
         super().paintEvent(event)
-        now = datetime.datetime.now()
-        self.clock_label.setText(now.strftime("%X"))
-
-        if self.epg_list:
-            hours = [toLocalTime(x[0]) for x in self.epg_list]
-            now = datetime.datetime.strptime(datetime.datetime.now().strftime("%H:%M"), "%H:%M")
-            current = [x for x in itertools.takewhile(lambda t: now >= datetime.datetime.strptime(t, "%H:%M"), hours)][-1]
-
-            for idx, epg_line in enumerate(self.epg_list):
-                if toLocalTime(epg_line[0]) == current:
-                    self.show_name_label.setText(epg_line[1])
-
-                    if len(self.epg_list) > idx + 1:
-                        start_time = datetime.datetime.strptime(toLocalTime(epg_line[0]), "%H:%M")
-                        end_time = datetime.datetime.strptime(toLocalTime(self.epg_list[idx + 1][0]), "%H:%M")
-                        elapsed_time = datetime.datetime.strptime(datetime.datetime.now().strftime("%H:%M"), "%H:%M")
-                        show_duration = end_time - start_time
-                        elapsed_duration = elapsed_time - start_time
-                        self.show_progress.setMinimum(0)
-                        self.show_progress.setMaximum(show_duration.seconds)
-                        self.show_progress.setValue(elapsed_duration.seconds)
-                        self.show_progress.show()
-                    return
-
-        self.show_name_label.setText("")
+        self.paint_time += time.perf_counter() - start
+        self.paint_count += 1
 
     def keyPressEvent(self, event):
         super().keyPressEvent(event)
@@ -0,0 +1,102 @@
+import os
+import glob
+import hashlib
+import logging
+from collections import OrderedDict
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QPixmap
+
+import paths
+
+log = logging.getLogger(__name__)
+DEFAULT_CAPACITY = 512
+THUMBNAIL_CACHE_SIZE = 32 * 1024 * 1024
+
+class PixmapCache:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.pixmaps = OrderedDict()  # (channel id, width, height) -> QPixmap
+
+    def pixmap(self, channel, size, device_pixel_ratio=1.0):
+        key = (channel.id, size.width(), size.height())
+        pixmap = self.pixmaps.get(key, None)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+            return pixmap
+
+        pixmap = ThumbnailCache.pixmap(channel.icon, size, device_pixel_ratio)
+        self.pixmaps[key] = pixmap
+        if len(self.pixmaps) > self.capacity:
+            self.pixmaps.popitem(last=False)
+        return pixmap
+
+    def invalidate(self, channel_id):
+        for key in [key for key in self.pixmaps if key[0] == channel_id]:
+            del self.pixmaps[key]
+
+    def clear(self):
+        self.pixmaps.clear()
+
+
+class ThumbnailCache:
+    # Pre-scaled icons stored on disk, named after a hash of the original
+    # icon bytes so a changed icon simply maps to a different file. A file's
+    # mtime is its last use, prune() drops the least recently used ones.
+    @staticmethod
+    def path_for(data, width, height):
+        return os.path.join(
+            paths.THUMBNAIL_CACHE_DIR,
+            "{0}-{1}x{2}.png".format(hashlib.sha1(data).hexdigest(), width, height)
+        )
+
+    @staticmethod
+    def image(data, size):
+        if not data:
+            return QImage()
+
+        path = ThumbnailCache.path_for(data, size.width(), size.height())
+        image = QImage()
+        if os.path.isfile(path) and image.load(path, 'PNG'):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return image
+
+        if not image.loadFromData(data):
+            return QImage()
+        image = image.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+        tmp_path = path + '.tmp'
+        if image.save(tmp_path, 'PNG'):
+            os.replace(tmp_path, path)
+        else:
+            log.debug('Failed to write thumbnail: {0}'.format(path))
+        return image
+
+    @staticmethod
+    def pixmap(data, size, device_pixel_ratio=1.0):
+        image = ThumbnailCache.image(data, size * device_pixel_ratio)
+        pixmap = QPixmap.fromImage(image)
+        pixmap.setDevicePixelRatio(device_pixel_ratio)
+        return pixmap
+
+    @staticmethod
+    def prune(max_size=THUMBNAIL_CACHE_SIZE):
+        thumbnails = []
+        for path in glob.glob(os.path.join(paths.THUMBNAIL_CACHE_DIR, '*.png')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            thumbnails.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for mtime, size, path in thumbnails)
+        for mtime, size, path in sorted(thumbnails):
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                log.debug('Failed to remove thumbnail {0}: {1}'.format(path, e))
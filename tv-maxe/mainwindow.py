@@ -4,11 +4,14 @@ from PyQt5 import uic
 from PyQt5.QtGui import QIcon, QPixmap
 from PyQt5.QtCore import pyqtSlot
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, QAction, QActionGroup,
-    QMenu)
+    QMenu, QMessageBox)
 
 from channellistmanager import ChannelListManager
 from settings import SettingsDialog
 from addchanneldialog import AddChannelDialog
+from epgprefetch import EPGPrefetcher
+from zapstats import ZapStats, ZapStatsDialog
+from recorder import Recorder
 from txicon import TXIcon
 
 log = logging.getLogger(__name__)
@@ -24,6 +27,13 @@ class TVMaxeMainWindow(QMainWindow):
         self.volume_slider.sliderMoved.connect(self.volume_changed)
         self.tv_channel_list.channelActivated.connect(self.activated_channel)
         self.radio_channel_list.channelActivated.connect(self.activated_channel)
+        self.recorder = Recorder(self.video_player, self)
+        self.recorder.recording_started.connect(self.recording_started)
+        self.recorder.recording_finished.connect(self.recording_finished)
+        self.recorder.recording_error.connect(self.recording_error)
+        for channel_list in [self.tv_channel_list, self.radio_channel_list]:
+            channel_list.recordRequested.connect(self.record_channel)
+            channel_list.recordingScheduled.connect(self.schedule_recording)
         
         self.video_player.playback_started.connect(self.video_playback_started)
         self.video_player.playback_paused.connect(self.video_playback_paused)
@@ -34,8 +44,13 @@ class TVMaxeMainWindow(QMainWindow):
         self.video_player.chromecast_connected.connect(self.chromecast_connected)
 
         self.chlist_manager = ChannelListManager()
-        self.chlist_manager.channel_added.connect(self.channel_added)
+        self.chlist_manager.channels_added.connect(self.channels_added)
+        self.chlist_manager.channels_changed.connect(self.channels_changed)
+        self.chlist_manager.channels_removed.connect(self.channels_removed)
         self.chlist_manager.channellist_available.connect(self.channel_list_available)
+        self.epg_prefetcher = EPGPrefetcher(self)
+        self.last_channel = None
+        self.chlist_manager.channellist_available.connect(self.epg_prefetcher.prefetch_chlist)
 
         self.statusbar.addPermanentWidget(self.bottom_bar, 1)
         self.splitter.setStretchFactor(1, 1)
@@ -134,14 +149,22 @@ class TVMaxeMainWindow(QMainWindow):
             self.tv_channel_list.showAllChannelLists()
             self.radio_channel_list.showAllChannelLists()
 
-    def channel_added(self, channel):
-        if channel.type == 'tv':
-            self.tv_channel_list.addChannel(channel)
-        elif channel.type == 'radio':
-            self.radio_channel_list.addChannel(channel)
+    def channels_added(self, channels):
+        self.tv_channel_list.addChannels([channel for channel in channels if channel.type == 'tv'])
+        self.radio_channel_list.addChannels([channel for channel in channels if channel.type == 'radio'])
+
+    def channels_changed(self, channels):
+        self.tv_channel_list.updateChannels([channel for channel in channels if channel.type == 'tv'])
+        self.radio_channel_list.updateChannels([channel for channel in channels if channel.type == 'radio'])
+
+    def channels_removed(self, channels):
+        self.tv_channel_list.removeChannels([channel for channel in channels if channel.type == 'tv'])
+        self.radio_channel_list.removeChannels([channel for channel in channels if channel.type == 'radio'])
 
     def play_channel(self, channel, play_index=0):
-        self.video_player.stop()
+        ZapStats.start(channel)
+        self.video_player.stop(zapping=True)
+        ZapStats.mark('stopped')
         self.progress_bar.setMinimum(0)
         self.progress_bar.setMaximum(0)
         self.progress_bar.show()
@@ -149,6 +172,43 @@ class TVMaxeMainWindow(QMainWindow):
             self.tr("Now loading: {0} ({1})".format(channel.name, channel.streamurls[play_index]))
         )
         self.video_player.play_channel(channel, play_index)
+        self.prewarm_channels(channel)
+
+    def prewarm_channels(self, channel):
+        channel_list = self.tv_channel_list if channel.type == 'tv' else self.radio_channel_list
+        candidates = channel_list.neighbourChannels(channel)
+        if self.last_channel and self.last_channel.id != channel.id:
+            # Zapping back is the likeliest, and its session was just kept
+            # warm by the player
+            candidates.insert(0, self.last_channel)
+        self.last_channel = channel
+        self.video_player.prewarmer.warm([c for c in candidates if c.id != channel.id])
+
+    def record_channel(self, channel):
+        recording = self.recorder.recording_for(channel)
+        if recording:
+            self.recorder.stop(recording)
+        else:
+            self.recorder.record(channel)
+
+    def schedule_recording(self, channel, start_time, end_time, title):
+        self.recorder.schedule(channel, start_time, end_time, title)
+        self.statusbar.showMessage(
+            self.tr("Scheduled recording: {0} ({1})").format(title, channel.name), 5000
+        )
+
+    def recording_started(self, recording):
+        self.statusbar.showMessage(self.tr("Recording: {0}").format(recording.channel.name), 5000)
+
+    def recording_finished(self, recording):
+        self.statusbar.showMessage(self.tr("Recording saved: {0}").format(recording), 10000)
+
+    def recording_error(self, channel, error_message):
+        QMessageBox.critical(
+            self,
+            self.tr("Recording error"),
+            self.tr("Cannot record {0}: {1}").format(channel.name, error_message)
+        )
 
     def video_playback_started(self, channel):
         self.play_btn.setIcon(TXIcon('icons/pause-button.svg'))
@@ -230,6 +290,11 @@ class TVMaxeMainWindow(QMainWindow):
         settings_dialog = SettingsDialog(self)
         settings_dialog.exec()
 
+    @pyqtSlot()
+    def showDiagnostics(self):
+        diagnostics_dialog = ZapStatsDialog(self)
+        diagnostics_dialog.exec()
+
     @pyqtSlot()
     def showAddChannelDialog(self):
         add_channel_dialog = AddChannelDialog(self)
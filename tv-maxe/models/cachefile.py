@@ -0,0 +1,71 @@
+import os
+import glob
+import logging
+import tempfile
+
+import paths
+
+log = logging.getLogger(__name__)
+PARTIAL_SUFFIX = '.part'
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+class CacheFileError(Exception):
+    pass
+
+
+class CacheFile:
+    # Receives a download in chunks into a temporary file next to the cache,
+    # and only moves it over the real cache file once it is complete and
+    # synced to disk
+    def __init__(self):
+        fd, self.tmp_path = tempfile.mkstemp(suffix=PARTIAL_SUFFIX, dir=paths.CACHE_DIR)
+        self.fh = os.fdopen(fd, 'wb')
+        self.size = 0
+        self.header = b''
+
+    def write(self, data):
+        if len(self.header) < len(SQLITE_HEADER):
+            self.header += data[:len(SQLITE_HEADER) - len(self.header)]
+        self.fh.write(data)
+        self.size += len(data)
+
+    def is_valid(self):
+        return self.header == SQLITE_HEADER
+
+    def commit(self, path):
+        try:
+            if not self.is_valid():
+                raise CacheFileError('Downloaded data is not a SQLite database')
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+            self.fh.close()
+            for suffix in ['-wal', '-shm']:
+                if os.path.isfile(path + suffix):
+                    os.remove(path + suffix)
+            os.replace(self.tmp_path, path)
+            CacheFile.sync_directory(os.path.dirname(path))
+        except Exception:
+            self.abort()
+            raise
+
+    def abort(self):
+        if not self.fh.closed:
+            self.fh.close()
+        if os.path.isfile(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    @staticmethod
+    def sync_directory(path):
+        if not hasattr(os, 'O_DIRECTORY'):
+            return  # Windows can't open directories, rename is durable enough there
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def remove_stale():
+        for tmp_path in glob.glob(os.path.join(paths.CACHE_DIR, '*' + PARTIAL_SUFFIX)):
+            log.debug('Removing unfinished download: {0}'.format(tmp_path))
+            os.remove(tmp_path)
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from functools import reduce
+
+import paths
+
+log = logging.getLogger(__name__)
+
+class CacheIndex:
+    # url -> {"filename", "size", "fetched_at", "etag", "last_modified"},
+    # read from disk once and written back on every change
+    _entries = None
+
+    @staticmethod
+    def entries():
+        if CacheIndex._entries is None:
+            CacheIndex._entries = {}
+            if os.path.isfile(paths.CACHE_INDEX):
+                try:
+                    with open(paths.CACHE_INDEX, 'r') as fh:
+                        CacheIndex._entries = json.load(fh)
+                except (OSError, ValueError) as e:
+                    log.error('Failed to read cache index {0}: {1}'.format(paths.CACHE_INDEX, e))
+        return CacheIndex._entries
+
+    @staticmethod
+    def save():
+        tmp_path = paths.CACHE_INDEX + '.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump(CacheIndex.entries(), fh, indent=1)
+        os.replace(tmp_path, paths.CACHE_INDEX)
+
+    @staticmethod
+    def filename_for_url(url):
+        return "{0}.db".format(hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    @staticmethod
+    def legacy_filename_for_url(url):
+        return "{0}.db".format(str(reduce(lambda x,y:x+y, map(ord, url))))
+
+    @staticmethod
+    def get(url):
+        return CacheIndex.entries().get(url, None)
+
+    @staticmethod
+    def path_for_url(url):
+        return os.path.join(paths.CACHE_DIR, CacheIndex.filename_for_url(url))
+
+    @staticmethod
+    def cached_path(url):
+        entry = CacheIndex.get(url)
+        if entry:
+            return os.path.join(paths.CACHE_DIR, entry['filename'])
+        return None
+
+    @staticmethod
+    def update(url, **fields):
+        entry = CacheIndex.entries().setdefault(url, {
+            "filename": CacheIndex.filename_for_url(url),
+            "size": 0,
+            "fetched_at": None,
+            "etag": None,
+            "last_modified": None
+        })
+        entry.update(fields)
+        CacheIndex.save()
+
+    @staticmethod
+    def stored(url, size):
+        CacheIndex.update(url, size=size, fetched_at=time.time())
+
+    @staticmethod
+    def remove(url):
+        if CacheIndex.entries().pop(url, None):
+            CacheIndex.save()
+
+    @staticmethod
+    def migrate_legacy(urls):
+        # Cache files used to be named after the sum of the URL's character
+        # codes. Files that more than one URL maps to can't be attributed and
+        # are dropped, the rest are renamed and indexed.
+        legacy_names = {}
+        for url in urls:
+            legacy_names.setdefault(CacheIndex.legacy_filename_for_url(url), []).append(url)
+
+        changed = False
+        for legacy_name, legacy_urls in legacy_names.items():
+            legacy_path = os.path.join(paths.CACHE_DIR, legacy_name)
+            if not os.path.isfile(legacy_path):
+                continue
+
+            for suffix in ['-wal', '-shm']:
+                if os.path.isfile(legacy_path + suffix):
+                    os.remove(legacy_path + suffix)
+
+            if len(legacy_urls) > 1:
+                log.debug('Dropping ambiguous legacy cache file: {0}'.format(legacy_path))
+                os.remove(legacy_path)
+                continue
+
+            url = legacy_urls[0]
+            if CacheIndex.get(url):
+                os.remove(legacy_path)
+                continue
+
+            log.debug('Migrating legacy cache file {0} for {1}'.format(legacy_path, url))
+            os.replace(legacy_path, CacheIndex.path_for_url(url))
+            CacheIndex.entries()[url] = {
+                "filename": CacheIndex.filename_for_url(url),
+                "size": os.path.getsize(CacheIndex.path_for_url(url)),
+                "fetched_at": os.path.getmtime(CacheIndex.path_for_url(url)),
+                "etag": None,
+                "last_modified": None
+            }
+            changed = True
+
+        if changed:
+            CacheIndex.save()
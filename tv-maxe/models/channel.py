@@ -2,19 +2,46 @@ import json
 import paths
 
 class Channel:
-    def __init__(self, row, type='tv', origin=paths.LOCAL_CHANNEL_DB):
+    def __init__(self, row, type='tv', origin=paths.LOCAL_CHANNEL_DB, icon_loader=None):
         row = dict(row)
         self.type = type
         self.origin = origin
         self.id = str(row['id'])
-        self.icon = row['icon']
         self.name = str(row['name'])
-        self.streamurls = json.loads(row['streamurls'])
-        self.params = json.loads(row.get("params", "{}"))
         self.guide = row.get("guide", "")
-        self.audiochannels = json.loads(row.get("audiochannels", "[]"))
+        self._icon = row.get('icon', None)
+        self._icon_loader = icon_loader  # fetches the icon blob on demand when the row didn't carry it
+        self._json = {
+            "streamurls": row['streamurls'],
+            "params": row.get("params", "{}"),
+            "audiochannels": row.get("audiochannels", "[]")
+        }
+        self._decoded = {}  # streamurls is decoded as soon as a model filters on it, the rest on first use
         self._play_index = 0  # url to play from streamurls
 
+    def _decode(self, key):
+        if key not in self._decoded:
+            self._decoded[key] = json.loads(self._json[key])
+        return self._decoded[key]
+
+    @property
+    def icon(self):
+        if self._icon is None and self._icon_loader:
+            return self._icon_loader()
+        return self._icon
+
+    @property
+    def streamurls(self):
+        return self._decode("streamurls")
+
+    @property
+    def params(self):
+        return self._decode("params")
+
+    @property
+    def audiochannels(self):
+        return self._decode("audiochannels")
+
     def args(self, url):
         return self.params.get(url, {})
 
@@ -0,0 +1,23 @@
+class ChannelListDiff:
+    def __init__(self, old_snapshot, new_snapshot):
+        self.added = []
+        self.changed = []
+        self.removed = []
+
+        for key, (content_hash, row, table) in new_snapshot.items():
+            if key not in old_snapshot:
+                self.added.append((key[0], row, table))
+            elif old_snapshot[key][0] != content_hash:
+                self.changed.append((key[0], row, table))
+
+        for key, (content_hash, row, table) in old_snapshot.items():
+            if key not in new_snapshot:
+                self.removed.append((key[0], row, table))
+
+    def is_empty(self):
+        return not (self.added or self.changed or self.removed)
+
+    def __str__(self):
+        return '{0} added, {1} changed, {2} removed'.format(
+            len(self.added), len(self.changed), len(self.removed)
+        )
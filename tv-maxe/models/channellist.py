@@ -2,33 +2,46 @@ import os
 import logging
 import sqlite3
 import getpass
-from functools import reduce
+import hashlib
+from functools import partial
 
 import paths
 from models.channel import Channel
+from models.database import Database
+from models.cacheindex import CacheIndex
 
 log = logging.getLogger(__name__)
+CHANNEL_BATCH_SIZE = 100
+CHANNEL_TABLES = [
+    ('tv', 'tv_channels', 'id, name, streamurls, params, guide, audiochannels'),
+    ('radio', 'radio_channels', 'id, name, streamurls, params')
+]
 
 class ChannelList:
-    def __init__(self, data, origin_url=None):
-        self.data = data
+    loaded = {}  # origin_url -> the ChannelList currently backing that origin's channels
+
+    def __init__(self, origin_url=None):
         self.origin_url = origin_url
+        self._db = None
+        self._info = None
+        self._rowids = {}  # table -> {channel id: rowid}
+        self.closed = False
         if origin_url:
             self.cached_path = ChannelList.local_filename_for_url(origin_url)
-
-            log.debug('Caching channel list "{0}" to: {1}'.format(origin_url, self.cached_path))
-            fh = open(self.cached_path, 'wb')
-            fh.write(self.data)
-            fh.close()
         else:
             self.cached_path = self.origin_url = paths.LOCAL_CHANNEL_DB
 
     @staticmethod
     def local_filename_for_url(origin_url):
-        return os.path.join(
-            paths.CACHE_DIR,
-            "{0}.db".format(str(reduce(lambda x,y:x+y, map(ord, origin_url))))
-        )
+        return CacheIndex.cached_path(origin_url) or CacheIndex.path_for_url(origin_url)
+
+    @staticmethod
+    def remove_journal(path):
+        # A WAL file left behind by a previous connection must never be
+        # replayed on top of a freshly downloaded database
+        for suffix in ['-wal', '-shm']:
+            if os.path.isfile(path + suffix):
+                os.remove(path + suffix)
 
     @staticmethod
     def create_user_db():
@@ -46,96 +59,121 @@ class ChannelList:
         conn.commit()
         conn.close()
 
-        fh = open(paths.LOCAL_CHANNEL_DB, 'rb')
-        data = fh.read()
-        fh.close()
-        return ChannelList(data)
+        return ChannelList()
 
     @property
-    def name(self):
-        conn = sqlite3.connect(self.cached_path)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-
-        c.execute("SELECT * FROM info")
-        row = c.fetchone()
-        conn.close()
-        return row['name']
+    def db(self):
+        if self.closed:
+            raise sqlite3.ProgrammingError('Channel list {0} is closed'.format(self.origin_url))
+        if not self._db:
+            self._db = Database(self.cached_path)
+        return self._db
+
+    def close(self):
+        # Final: the file behind a closed list may have been replaced already
+        self.closed = True
+        if self._db:
+            self._db.close()
+            self._db = None
+        self._info = None
+        self._rowids = {}
 
     @property
-    def epg_url(self):
-        conn = sqlite3.connect(self.cached_path)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-
-        c.execute("SELECT * FROM info")
-        row = c.fetchone()
-        conn.close()
-        return row['epgurl']
+    def info(self):
+        if not self._info:
+            self._info = self.db.fetchone("SELECT * FROM info")
+        return self._info
 
     @property
-    def tv_channels(self):
-        channels = []
-
-        conn = sqlite3.connect(self.cached_path)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
-
-        c.execute("SELECT * FROM tv_channels")
-        for row in c.fetchall():
-            channel = Channel(row, 'tv', self.origin_url)
-            channels.append(channel)
-            log.debug('Found TV Channel: {0} with ID: {1}'.format(channel.name, channel.id))
-        
-        conn.close()
-
-        return channels
+    def name(self):
+        return self.info['name']
 
     @property
-    def radio_channels(self):
-        channels = []
-
-        conn = sqlite3.connect(self.cached_path)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
+    def epg_url(self):
+        return self.info['epgurl']
+
+    def iter_channels(self, batch_size=CHANNEL_BATCH_SIZE):
+        # Yields channels in batches straight from a cursor; icon blobs are
+        # left in the database until something actually asks for them
+        for channel_type, table, columns in CHANNEL_TABLES:
+            cursor = self.db.cursor("SELECT rowid, {0} FROM {1}".format(columns, table))
+            rows = cursor.fetchmany(batch_size)
+            while rows:
+                yield [self.channel_from_row(row, channel_type, table) for row in rows]
+                rows = cursor.fetchmany(batch_size)
+
+    def channel_ids(self, channel_type='tv'):
+        for type, table, columns in CHANNEL_TABLES:
+            if type == channel_type:
+                return [str(row['id']) for row in self.db.fetchall("SELECT id FROM {0}".format(table))]
+        return []
+
+    def channel_from_row(self, row, channel_type, table):
+        return Channel(row, channel_type, self.origin_url, partial(ChannelList.icon_for, self.origin_url, table, str(row['id'])))
+
+    def snapshot(self):
+        # Maps (type, id) to a content hash and the icon-less row, enough to
+        # diff this list against a refreshed copy after the file is replaced
+        snapshot = {}
+        for channel_type, table, columns in CHANNEL_TABLES:
+            for row in self.db.cursor("SELECT rowid, {0}, icon FROM {1}".format(columns, table)):
+                row = dict(row)
+                icon = row.pop('icon')
+                snapshot[(channel_type, str(row['id']))] = (ChannelList.content_hash(row, icon), row, table)
+        return snapshot
 
-        c.execute("SELECT * FROM radio_channels")
-        for row in c.fetchall():
-            channel = Channel(row, 'radio', self.origin_url)
-            channels.append(channel)
-            log.debug('Found Radio Channel: {0} with ID: {1}'.format(channel.name, channel.id))
-        
-        conn.close()
+    @staticmethod
+    def content_hash(row, icon):
+        content = hashlib.sha1()
+        for key in sorted(row.keys()):
+            if key == 'rowid':
+                continue
+            content.update(str(row[key]).encode('utf-8'))
+            content.update(b'\0')
+        content.update(icon or b'')
+        return content.digest()
 
-        return channels
+    @staticmethod
+    def icon_for(origin_url, table, channel_id):
+        # Icons are read through whichever list is loaded for the origin now,
+        # so channels kept across a refresh read the new file
+        chlist = ChannelList.loaded.get(origin_url)
+        if not chlist or chlist.closed:
+            return None
+        return chlist.channel_icon(table, channel_id)
+
+    def channel_icon(self, table, channel_id):
+        if table not in self._rowids:
+            self._rowids[table] = {
+                str(row['id']): row['rowid'] for row in self.db.cursor("SELECT rowid, id FROM {0}".format(table))
+            }
+        rowid = self._rowids[table].get(channel_id)
+        if rowid is None:
+            return None
+        row = self.db.fetchone("SELECT icon FROM {0} WHERE rowid=?".format(table), (rowid, ))
+        if row:
+            return row['icon']
+        return None
 
     def save_channel(self, channel):
-        conn = sqlite3.connect(self.cached_path)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
+        self._rowids = {}
         if channel.type == 'tv':
-            c.execute("""INSERT INTO tv_channels (id, icon, name, streamurls, params, guide, audiochannels)
+            self.db.execute("""INSERT INTO tv_channels (id, icon, name, streamurls, params, guide, audiochannels)
                             VALUES (:id, :icon, :name, :streamurls, :params, :guide, :audiochannels)""",
                             channel.to_dict()
             )
         else:
-            c.execute("""INSERT INTO radio_channels (id, icon, name, streamurls, params)
+            self.db.execute("""INSERT INTO radio_channels (id, icon, name, streamurls, params)
                             VALUES (:id, :icon, :name, :streamurls, :params)""",
                             channel.to_dict()
             )
-        conn.commit()
-        conn.close()
 
     def remove_channel(self, channel):
-        conn = sqlite3.connect(self.cached_path)
-        conn.row_factory = sqlite3.Row
-        c = conn.cursor()
+        self._rowids = {}
         if channel.type == 'tv':
-            c.execute("DELETE FROM tv_channels WHERE id=?", (channel.id, ))
+            self.db.execute("DELETE FROM tv_channels WHERE id=?", (channel.id, ))
         else:
-            c.execute("DELETE FROM radio_channels WHERE id=?", (channel.id, ))
-        conn.commit()
-        conn.close()
+            self.db.execute("DELETE FROM radio_channels WHERE id=?", (channel.id, ))
 
     def __eq__(self, obj):
         if isinstance(obj, ChannelList):
@@ -0,0 +1,46 @@
+import logging
+import sqlite3
+
+log = logging.getLogger(__name__)
+
+STATEMENT_CACHE_SIZE = 256
+
+class Database:
+    # One lazily opened connection per database file, reused (along with its
+    # prepared statement cache) until close() is called.
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    @property
+    def connection(self):
+        if not self._conn:
+            log.debug('Opening database: {0}'.format(self.path))
+            self._conn = sqlite3.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
+
+    @property
+    def is_open(self):
+        return self._conn is not None
+
+    def fetchone(self, query, params=()):
+        return self.connection.execute(query, params).fetchone()
+
+    def fetchall(self, query, params=()):
+        return self.connection.execute(query, params).fetchall()
+
+    def cursor(self, query, params=()):
+        return self.connection.execute(query, params)
+
+    def execute(self, query, params=()):
+        with self.connection:
+            self.connection.execute(query, params)
+
+    def close(self):
+        if self._conn:
+            log.debug('Closing database: {0}'.format(self.path))
+            self._conn.close()
+            self._conn = None
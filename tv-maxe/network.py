@@ -0,0 +1,161 @@
+import time
+import logging
+from collections import deque
+from PyQt5.QtNetwork import QNetworkAccessManager, QNetworkDiskCache, QNetworkRequest, QNetworkReply
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import paths
+from util import bytes2human
+
+log = logging.getLogger(__name__)
+DISK_CACHE_SIZE = 50 * 1024 * 1024
+DEFAULT_MAX_REQUESTS = 8
+
+class NetworkJob(QObject):
+    # A GET request that may still be waiting for a free slot. Once started
+    # it forwards the QNetworkReply calls consumers use, so it can be handled
+    # just like a reply.
+    ready_read = pyqtSignal('PyQt_PyObject')
+    finished = pyqtSignal('PyQt_PyObject')
+
+    def __init__(self, request, low_priority=False, parent=None):
+        super().__init__(parent)
+        self.request = request
+        self.low_priority = low_priority
+        self.reply = None
+        self.aborted = False
+        self.bytes_received = 0
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+
+    def url(self):
+        return self.request.url()
+
+    def abort(self):
+        self.aborted = True
+        if self.reply:
+            self.reply.abort()
+        elif self.parent():
+            self.parent().cancel(self)
+
+    def error(self):
+        if self.reply:
+            return self.reply.error()
+        return QNetworkReply.OperationCanceledError
+
+    def errorString(self):
+        if self.reply:
+            return self.reply.errorString()
+        return "Operation canceled"
+
+    def attribute(self, code):
+        if self.reply:
+            return self.reply.attribute(code)
+        return None
+
+    def hasRawHeader(self, name):
+        return self.reply is not None and self.reply.hasRawHeader(name)
+
+    def rawHeader(self, name):
+        return self.reply.rawHeader(name)
+
+    def readAll(self):
+        data = self.reply.readAll()
+        self.bytes_received += data.size()
+        return data
+
+    @property
+    def queue_time(self):
+        return (self.started_at or self.finished_at or time.perf_counter()) - self.queued_at
+
+    @property
+    def transfer_time(self):
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+class NetworkService(QObject):
+    # The application-wide QNetworkAccessManager: connections to a host are
+    # kept alive and reused, cacheable responses go to an on-disk HTTP cache
+    # and at most max_requests requests are in flight at any time
+    def __init__(self, parent=None, max_requests=DEFAULT_MAX_REQUESTS):
+        super().__init__(parent)
+        self.max_requests = max_requests
+        self.access_manager = QNetworkAccessManager(self)
+        self.access_manager.finished.connect(self.handle_response)
+
+        self.disk_cache = QNetworkDiskCache(self)
+        self.disk_cache.setCacheDirectory(paths.HTTP_CACHE_DIR)
+        self.disk_cache.setMaximumCacheSize(DISK_CACHE_SIZE)
+        self.access_manager.setCache(self.disk_cache)
+
+        self.queue = deque()
+        self.low_priority_queue = deque()
+        self.jobs = {}  # QNetworkReply -> NetworkJob
+        self.stats = {}  # host -> {"requests", "errors", "bytes", "queue_time", "transfer_time"}
+
+    def get(self, request, low_priority=False):
+        job = NetworkJob(request, low_priority, self)
+        if low_priority:
+            self.low_priority_queue.append(job)
+        else:
+            self.queue.append(job)
+        self.start_jobs()
+        return job
+
+    def promote(self, job):
+        if job in self.low_priority_queue:
+            self.low_priority_queue.remove(job)
+            self.queue.append(job)
+
+    def cancel(self, job):
+        for queue in [self.queue, self.low_priority_queue]:
+            if job in queue:
+                queue.remove(job)
+                job.finished_at = time.perf_counter()
+                job.finished.emit(job)
+                job.deleteLater()
+                return
+
+    def start_jobs(self):
+        while len(self.jobs) < self.max_requests and (self.queue or self.low_priority_queue):
+            job = self.queue.popleft() if self.queue else self.low_priority_queue.popleft()
+            job.started_at = time.perf_counter()
+            job.reply = self.access_manager.get(job.request)
+            job.reply.readyRead.connect(lambda job=job: job.ready_read.emit(job))
+            self.jobs[job.reply] = job
+
+    def handle_response(self, reply):
+        job = self.jobs.pop(reply, None)
+        if not job:
+            return
+
+        job.finished_at = time.perf_counter()
+        job.finished.emit(job)
+        self.record(job)
+        reply.deleteLater()
+        job.deleteLater()
+        self.start_jobs()
+
+    def record(self, job):
+        host = job.url().host()
+        stats = self.stats.setdefault(host, {
+            "requests": 0, "errors": 0, "bytes": 0, "queue_time": 0.0, "transfer_time": 0.0
+        })
+        stats["requests"] += 1
+        stats["bytes"] += job.bytes_received
+        stats["queue_time"] += job.queue_time
+        stats["transfer_time"] += job.transfer_time
+        if job.error() != QNetworkReply.NoError:
+            stats["errors"] += 1
+
+        log.debug('GET {0}: {1}, {2} in {3:.0f} ms (queued {4:.0f} ms{5})'.format(
+            job.url().toString(),
+            job.attribute(QNetworkRequest.HttpStatusCodeAttribute) or job.errorString(),
+            bytes2human(job.bytes_received),
+            job.transfer_time * 1000,
+            job.queue_time * 1000,
+            ', from cache' if job.attribute(QNetworkRequest.SourceIsFromCacheAttribute) else ''
+        ))
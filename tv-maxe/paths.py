@@ -5,6 +5,11 @@ HOME_DIR = str(Path.home())
 CACHE_DIR = os.path.join(HOME_DIR, *['.tv-maxe-ng', 'cache'])
 LOCAL_CHANNEL_DB = os.path.join(CACHE_DIR, 'user.db')
 EPG_CACHE = os.path.join(CACHE_DIR, 'epg_cache.db')
+CACHE_INDEX = os.path.join(CACHE_DIR, 'index.json')
+THUMBNAIL_CACHE_DIR = os.path.join(CACHE_DIR, 'thumbnails')
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, 'http')
+TIMESHIFT_DIR = os.path.join(CACHE_DIR, 'timeshift')
 
-if not os.path.exists(CACHE_DIR):
-	os.makedirs(CACHE_DIR)
\ No newline at end of file
+for cache_dir in [CACHE_DIR, THUMBNAIL_CACHE_DIR, TIMESHIFT_DIR]:
+	if not os.path.exists(cache_dir):
+		os.makedirs(cache_dir)
\ No newline at end of file
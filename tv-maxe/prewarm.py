@@ -0,0 +1,138 @@
+import logging
+from collections import OrderedDict
+from urllib.parse import urlparse
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QObject
+
+from protocols import ProtocolException
+
+log = logging.getLogger(__name__)
+DEFAULT_SESSIONS = 2
+SKIPPED_SCHEMES = ['http', 'https']  # nothing to connect in advance
+
+class WarmSession:
+    def __init__(self, channel_id, url, protocol):
+        self.channel_id = channel_id
+        self.url = url
+        self.protocol = protocol
+        self.ready_url = None
+
+
+class ChannelPrewarmer(QObject):
+    # Starts the protocol of the channels the user is likely to switch to
+    # next, so their stream is already connected when they are activated.
+    # At most max_sessions protocols are kept running besides the one playing.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        settings = QApplication.instance().settings_manager
+        self.max_sessions = settings.value("player/prewarm_sessions", DEFAULT_SESSIONS, int)
+        self.sessions = OrderedDict()  # (channel id, url) -> WarmSession
+
+    @property
+    def enabled(self):
+        # Read on every use, it can be changed from the settings dialog
+        return QApplication.instance().settings_manager.value("player/prewarm", False, bool)
+
+    def warm(self, channels):
+        # channels are ordered by how likely they are to be played next
+        if not self.enabled or self.max_sessions <= 0:
+            self.clear()
+            return
+
+        wanted = []
+        for channel in channels:
+            if not channel or not channel.streamurls:
+                continue
+            key = (channel.id, channel.streamurls[0])
+            if key not in wanted and self.can_warm(key[1]):
+                wanted.append(key)
+        wanted = wanted[:self.max_sessions]
+
+        for key in list(self.sessions.keys()):
+            if key not in wanted:
+                self.stop_session(self.sessions.pop(key))
+
+        for channel in channels:
+            if not channel or not channel.streamurls:
+                continue
+            key = (channel.id, channel.streamurls[0])
+            if key in wanted and key not in self.sessions:
+                self.start_session(channel, key[1])
+
+    def can_warm(self, url):
+        scheme = urlparse(url).scheme
+        if scheme in SKIPPED_SCHEMES or scheme not in QApplication.instance().protocol_plugins:
+            return False
+        if scheme == 'sop' and QApplication.instance().settings_manager.value("sopcast/staticports", False, bool):
+            return False  # a second SopCast instance can't bind the same ports
+        return True
+
+    def start_session(self, channel, url):
+        protocol_class = QApplication.instance().protocol_plugins[urlparse(url).scheme]
+        log.debug('Pre-warming {0} via {1}'.format(channel.id, protocol_class.name))
+        try:
+            protocol = protocol_class(self)
+        except ProtocolException as e:
+            log.debug('Cannot pre-warm {0}: {1}'.format(channel.id, e.message))
+            return
+
+        session = WarmSession(channel.id, url, protocol)
+        self.sessions[(channel.id, url)] = session
+        protocol.protocol_ready.connect(lambda ready_url, session=session: self.session_ready(session, ready_url))
+        protocol.protocol_error.connect(lambda url, error, session=session: self.session_error(session, error))
+        try:
+            protocol.load_url(url, channel.args(url))
+        except ProtocolException as e:
+            self.session_error(session, e.message)
+
+    def session_ready(self, session, ready_url):
+        log.debug('Pre-warmed {0} is ready at {1}'.format(session.channel_id, ready_url))
+        session.ready_url = ready_url
+
+    def session_error(self, session, error):
+        log.debug('Pre-warming {0} failed: {1}'.format(session.channel_id, error))
+        if self.sessions.get((session.channel_id, session.url), None) is session:
+            del self.sessions[(session.channel_id, session.url)]
+            self.stop_session(session)
+
+    def keep(self, channel, url, protocol, ready_url):
+        # Takes over the session of the channel the player moves away from,
+        # so switching back to it doesn't reconnect. Returns whether it did;
+        # warm() stops it later if the channel is no longer a candidate.
+        if not self.enabled or self.max_sessions <= 0 or not self.can_warm(url):
+            return False
+
+        log.debug('Keeping the session of {0} warm'.format(channel.id))
+        previous = self.sessions.pop((channel.id, url), None)
+        if previous:
+            self.stop_session(previous)
+        session = WarmSession(channel.id, url, protocol)
+        session.ready_url = ready_url
+        self.sessions[(channel.id, url)] = session
+        protocol.setParent(self)
+        protocol.protocol_ready.connect(lambda ready_url, session=session: self.session_ready(session, ready_url))
+        protocol.protocol_error.connect(lambda url, error, session=session: self.session_error(session, error))
+        return True
+
+    def take(self, channel, url):
+        # Hands over the session for channel, if there is one: the caller
+        # owns the protocol afterwards and has to connect its signals.
+        session = self.sessions.pop((channel.id, url), None)
+        if not session:
+            return None
+
+        log.debug('Using pre-warmed session for {0}'.format(channel.id))
+        session.protocol.protocol_ready.disconnect()
+        session.protocol.protocol_error.disconnect()
+        session.protocol.setParent(self.parent())
+        return session
+
+    def stop_session(self, session):
+        log.debug('Stopping pre-warmed session for {0}'.format(session.channel_id))
+        session.protocol.protocol_ready.disconnect()
+        session.protocol.protocol_error.disconnect()
+        session.protocol.stop()
+
+    def clear(self):
+        while self.sessions:
+            self.stop_session(self.sessions.popitem()[1])
@@ -19,6 +19,7 @@ class Protocol(QObject):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.app = QApplication.instance()
+        self.playlist = False  # the ready URL is a playlist (HLS), not a continuous stream
 
     def load_url(self, url, args=None):
         pass
@@ -1,7 +1,70 @@
-from protocols import Protocol
 import logging
+import urllib.request
+from urllib.parse import urlparse
+from PyQt5.QtCore import QThread, QObject, pyqtSignal
+
+from protocols import Protocol
+from relay import StreamRelay, RELAY_CAPACITY
 
 log = logging.getLogger(__name__)
+OPEN_TIMEOUT = 30
+PLAYLIST_EXTENSIONS = ('.m3u8', '.m3u')
+PLAYLIST_TYPES = ['application/vnd.apple.mpegurl', 'application/x-mpegurl', 'audio/x-mpegurl', 'audio/mpegurl']
+
+class HTTPWorker(QObject):
+    # Opens the stream once and relays it through the stream server, so the
+    # player and other readers (the recorder) share one upstream connection.
+    # Playlists (HLS) are left to mpv, their segments are fetched by it.
+    stream_available = pyqtSignal(str)
+    playlist_available = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+    def __init__(self, url, stream_server, relay_capacity=RELAY_CAPACITY, parent=None):
+        super().__init__(parent=None)
+        self.url = url
+        self.stream_server = stream_server
+        self.relay_capacity = relay_capacity
+        self.response = None
+        self.relay = None
+        self.endpoint_path = None
+
+    def open_url(self):
+        if urlparse(self.url).path.lower().endswith(PLAYLIST_EXTENSIONS):
+            self.playlist_available.emit(self.url)
+            return
+
+        log.debug('Opening HTTP stream {0}'.format(self.url))
+        try:
+            self.response = urllib.request.urlopen(self.url, timeout=OPEN_TIMEOUT)
+            content_type = self.response.headers.get_content_type()
+            is_playlist = content_type in PLAYLIST_TYPES or self.response.peek(7)[:7] == b'#EXTM3U'
+        except (OSError, ValueError) as e:
+            log.debug('Failed to open HTTP stream: {0}'.format(e))
+            self.error.emit(str(e))
+            return
+
+        if is_playlist:
+            self.response.close()
+            self.response = None
+            self.playlist_available.emit(self.url)
+            return
+
+        self.relay = StreamRelay(self.response, self.relay_capacity)
+        self.relay.start()
+
+        self.endpoint_path = '/http/{0}'.format(id(self))
+        self.stream_server.add_endpoint(self.endpoint_path, self.relay.endpoint(content_type))
+        self.stream_available.emit(self.stream_server.url_for(self.endpoint_path))
+
+    def stop(self):
+        if self.endpoint_path:
+            self.stream_server.remove_endpoint(self.endpoint_path)
+            log.debug('Removed relay endpoint {0}'.format(self.endpoint_path))
+        if self.relay:
+            self.relay.stop()
+        if self.response:
+            self.response.close()
+            log.debug('Closed HTTP stream')
 
 class HTTP(Protocol):
     name = "HTTP Protocol"
@@ -11,12 +74,46 @@ class HTTP(Protocol):
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.worker = None
+
+    @property
+    def relay(self):
+        # The StreamRelay other readers (e.g. the recorder) can attach to
+        return self.worker.relay if self.worker else None
 
     def load_url(self, url, args=None):
+        log.debug('Playing {0}'.format(url))
+        self.worker_thread = QThread(self)
+        self.worker = HTTPWorker(
+            url,
+            self.app.stream_server,
+            self.app.settings_manager.value("relay/buffer_size", RELAY_CAPACITY, int)
+        )
+        self.worker.stream_available.connect(self.stream_available)
+        self.worker.playlist_available.connect(self.playlist_available)
+        self.worker.error.connect(self.error)
+        self.worker_thread.finished.connect(self.worker_thread_finished)
+        self.worker.moveToThread(self.worker_thread)
+        self.worker_thread.started.connect(self.worker.open_url)
+        self.worker_thread.start()
+
+    def stream_available(self, cb_url):
+        self.protocol_ready.emit(cb_url)
+
+    def playlist_available(self, url):
+        self.playlist = True
         self.protocol_ready.emit(url)
 
+    def error(self, error_msg):
+        self.protocol_error.emit(self.worker.url, error_msg)
+
     def stop(self):
+        self.worker.stop()
+        self.worker_thread.quit()
+
+    def worker_thread_finished(self):
+        log.debug('Worker thread finished')
         self.deleteLater()
 
 
-__classname__ = HTTP
\ No newline at end of file
+__classname__ = HTTP
@@ -1,32 +1,11 @@
 import librtmp
 import logging
-import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
 from PyQt5.QtCore import Qt, QThread, QObject, QTimer, QMetaObject, pyqtSignal, pyqtSlot
 
 from protocols import Protocol
-from util import get_open_port
+from relay import StreamRelay, RELAY_CAPACITY
 
 log = logging.getLogger(__name__)
-BUF_SIZE = 64 * 1024
-
-class RequestHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(200)
-        self.end_headers()
-
-        data = self.server.rtmp_stream.read(BUF_SIZE)
-        while data:
-            try:
-                self.wfile.write(data)
-            except (BrokenPipeError, ConnectionResetError) as e:
-                break
-            data = self.server.rtmp_stream.read(BUF_SIZE)
-
-        self.server.socket.close()
-        log.debug('End of stream')
-        return
-
 
 class RTMPWorker(QObject):
     stream_available = pyqtSignal(str)
@@ -35,11 +14,14 @@ class RTMPWorker(QObject):
         'swfhash', 'swfsize', 'swfurl', 'swfvfy', 'flashver', 'subscribe', 'token',
         'live', 'jtv', 'socks', 'start', 'stop', 'buffer', 'timeout']
 
-    def __init__(self, url, args, parent=None):
+    def __init__(self, url, args, stream_server, relay_capacity=RELAY_CAPACITY, parent=None):
         super().__init__(parent=None)
+        self.stream_server = stream_server
+        self.relay_capacity = relay_capacity
         self.conn = None
         self.rtmp_stream = None
-        self.httpd = None
+        self.relay = None
+        self.endpoint_path = None
         self.url = url
         self.params = {}
         
@@ -65,18 +47,19 @@ class RTMPWorker(QObject):
             self.error.emit(str(e))
             return
 
-        log.debug('Configuring HTTP server')
-        server_address = ('127.0.0.1', get_open_port())
-        self.httpd = HTTPServer(server_address, RequestHandler)
-        self.httpd.rtmp_stream = self.rtmp_stream
-        log.debug('Starting HTTP Server')
-        threading.Thread(target=self.httpd.serve_forever).start()
-        self.stream_available.emit('http://{0}:{1}'.format(server_address[0], server_address[1]))
+        self.relay = StreamRelay(self.rtmp_stream, self.relay_capacity)
+        self.relay.start()
+
+        self.endpoint_path = '/rtmp/{0}'.format(id(self))
+        self.stream_server.add_endpoint(self.endpoint_path, self.relay.endpoint('video/x-flv'))
+        self.stream_available.emit(self.stream_server.url_for(self.endpoint_path))
 
     def stop(self):
-        if self.httpd:
-            self.httpd.shutdown()
-            log.debug('Shut down HTTP server')
+        if self.endpoint_path:
+            self.stream_server.remove_endpoint(self.endpoint_path)
+            log.debug('Removed relay endpoint {0}'.format(self.endpoint_path))
+        if self.relay:
+            self.relay.stop()
         if self.rtmp_stream:
             self.rtmp_stream.close()
             log.debug('Closed RTMP connection stream')
@@ -92,12 +75,23 @@ class RTMP(Protocol):
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        self.worker = None
         log.debug('Using librtmp {0}'.format(librtmp.__version__))
 
+    @property
+    def relay(self):
+        # The StreamRelay other readers (e.g. the recorder) can attach to
+        return self.worker.relay if self.worker else None
+
     def load_url(self, url, args=None):
         log.debug('Playing {0}, args {1}'.format(url, args))
         self.worker_thread = QThread(self)
-        self.worker = RTMPWorker(url, args)
+        self.worker = RTMPWorker(
+            url,
+            args,
+            self.app.stream_server,
+            self.app.settings_manager.value("relay/buffer_size", RELAY_CAPACITY, int)
+        )
         self.worker.stream_available.connect(self.stream_available)
         self.worker.error.connect(self.error)
         self.worker_thread.finished.connect(self.worker_thread_finished)
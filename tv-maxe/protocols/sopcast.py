@@ -1,36 +1,18 @@
 import os
 import sys
-import subprocess
 import shutil
-import time
-import requests
 import logging
 from PyQt5.QtWidgets import QApplication
-from PyQt5.QtCore import Qt, QThread, QObject, QTimer, QMetaObject, pyqtSignal
+from PyQt5.QtCore import QProcess, QTimer
+from PyQt5.QtNetwork import QTcpSocket
 
 from protocols import Protocol, ProtocolException
 from util import get_open_port
 
 log = logging.getLogger(__name__)
-
-class Worker(QObject):
-    do_work = pyqtSignal()
-
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.timer = QTimer()
-        self.timer.setInterval(1000)
-        self.timer.timeout.connect(self._do_work)
-
-    def startTimer(self):
-        self.timer.start()
-
-    def stopTimer(self):
-        self.timer.stop()
-
-    def _do_work(self):
-        self.do_work.emit()
-
+PROBE_INITIAL_DELAY = 100  # ms
+PROBE_MAX_DELAY = 1000
+PROBE_TIMEOUT = 2000
 
 class SopCast(Protocol):
     name = "SopCast Protocol"
@@ -42,9 +24,17 @@ class SopCast(Protocol):
         super().__init__(parent)
 
         self.protocol_ready_emited = False
-        self.monitor_thread = None
-        self.worker = None
         self.spc = None
+        self.url = None
+        self.probe_socket = None
+        self.probe_response = b''
+        self.probe_delay = PROBE_INITIAL_DELAY
+        self.probe_timer = QTimer(self)
+        self.probe_timer.setSingleShot(True)
+        self.probe_timer.timeout.connect(self.probe)
+        self.probe_timeout = QTimer(self)
+        self.probe_timeout.setSingleShot(True)
+        self.probe_timeout.timeout.connect(self.probe_timed_out)
 
         self.spsc = None
         for spsc in ["sp-sc", "sp-sc-auth", "sop"]:
@@ -71,72 +61,110 @@ class SopCast(Protocol):
         log.debug('inport: {0}'.format(self.inport))
         log.debug('outport: {0}'.format(self.outport))
 
-    def _monitor_connection(self):
-        if not self.spc:
-            self.worker.stopTimer()
+    # Readiness: the player port answers a HEAD request with 200. Probes are
+    # non-blocking and retried with a growing delay while SopCast connects.
+    def schedule_probe(self):
+        if not self.spc or self.protocol_ready_emited:
+            return
+        self.probe_timer.start(self.probe_delay)
+        self.probe_delay = min(int(self.probe_delay * 1.5), PROBE_MAX_DELAY)
+
+    def probe(self):
+        self.probe_response = b''
+        self.probe_socket = QTcpSocket(self)
+        self.probe_socket.connected.connect(self.probe_connected)
+        self.probe_socket.readyRead.connect(self.probe_ready_read)
+        self.probe_socket.disconnected.connect(self.probe_failed)
+        self.probe_socket.error.connect(self.probe_failed)
+        self.probe_socket.connectToHost('127.0.0.1', int(self.outport))
+        self.probe_timeout.start(PROBE_TIMEOUT)
+
+    def probe_connected(self):
+        self.probe_socket.write(b'HEAD / HTTP/1.0\r\nHost: 127.0.0.1\r\n\r\n')
+
+    def probe_ready_read(self):
+        self.probe_response += bytes(self.probe_socket.readAll())
+        if b'\n' not in self.probe_response:
             return
 
-        if not self.protocol_ready_emited:
-            try:
-                r = requests.head('http://127.0.0.1:{0}'.format(self.outport))
-            except requests.exceptions.ConnectionError as e:
-                return
-
-            if r.status_code != 200:
-                return
-
+        status_line = self.probe_response.split(b'\n', 1)[0].split()
+        if len(status_line) >= 2 and status_line[1] == b'200':
+            self.close_probe()
             log.debug('Ready to play, emitting signal')
-            self.protocol_ready.emit(
-                "http://127.0.0.1:{0}".format(self.outport))
             self.protocol_ready_emited = True
+            self.protocol_ready.emit("http://127.0.0.1:{0}".format(self.outport))
+        else:
+            self.probe_failed()
+
+    def probe_failed(self, *args):
+        if self.probe_socket:
+            self.close_probe()
+            self.schedule_probe()
+
+    def probe_timed_out(self):
+        log.debug('SopCast player port did not answer in time')
+        self.probe_failed()
+
+    def close_probe(self):
+        self.probe_timeout.stop()
+        socket, self.probe_socket = self.probe_socket, None
+        if socket:
+            socket.connected.disconnect()
+            socket.readyRead.disconnect()
+            socket.disconnected.disconnect()
+            socket.error.disconnect()
+            socket.abort()
+            socket.deleteLater()
+
+    def process_error(self, error):
+        if error == QProcess.FailedToStart:
+            log.debug(self.spc.errorString())
+            self.process_exited()
+            self.protocol_error.emit(self.url, "Cannot start SopCast executable.")
+            self.url = None
+
+    def process_finished(self, exit_code, exit_status):
+        log.debug('SopCast exited with code {0}'.format(exit_code))
+        url = self.url
+        failed = exit_code != 0 or exit_status != QProcess.NormalExit or not self.protocol_ready_emited
+        self.process_exited()
+        if failed:
+            self.url = None
+            self.protocol_error.emit(url, "Stream not available.")
 
-        errorlevel = self.spc.poll()
-        if  errorlevel:
-            if errorlevel != -9:
-                self.protocol_error.emit(self.url, "Stream not available.")
-                self.spc = None
-                self.url = None
+    def process_exited(self):
+        self.probe_timer.stop()
+        self.close_probe()
+        if self.spc:
+            self.spc.finished.disconnect()
+            self.spc.errorOccurred.disconnect()
+            self.spc.deleteLater()
+            self.spc = None
 
     def load_url(self, url, args=None):
         self.protocol_ready_emited = False
-        self.monitor_thread = QThread(self)
-        self.worker = Worker()
-        self.worker.do_work.connect(self._monitor_connection)
-        self.monitor_thread.started.connect(self.worker.startTimer)
-        self.worker.moveToThread(self.monitor_thread)
+        self.probe_delay = PROBE_INITIAL_DELAY
 
         log.debug('Loading url: {0}'.format(url))
         self.url = url
-        try:
-            self.spc = subprocess.Popen(
-                [
-                    self.spsc,
-                    self.url,
-                    str(self.inport),
-                    str(self.outport)
-                ],
-                stdin=subprocess.DEVNULL,
-                stdout=subprocess.DEVNULL)
-            self.monitor_thread.start()
-        except Exception as e:
-            log.debug(str(e))
-            self.protocol_error.emit(url, "Cannot start SopCast executable.")
-            self.spc = None
-            self.url = None
+        self.spc = QProcess(self)
+        self.spc.setStandardInputFile(QProcess.nullDevice())
+        self.spc.setStandardOutputFile(QProcess.nullDevice())
+        self.spc.finished.connect(self.process_finished)
+        self.spc.errorOccurred.connect(self.process_error)
+        self.spc.start(self.spsc, [self.url, str(self.inport), str(self.outport)])
+        self.schedule_probe()
 
     def stop(self):
         log.debug('Stopping')
         self.url = None
         self.protocol_ready_emited = None
         if self.spc:
-            try:
-                os.kill(self.spc.pid, 9)
-            except ProcessLookupError as e:
-                log.debug('SopCast cannot be killed because it is already killed')
-                log.debug('What is dead may never die')
-            self.spc = None
-        self.worker.stopTimer()
-        self.monitor_thread.quit()
+            spc = self.spc
+            self.process_exited()
+            if spc.state() != QProcess.NotRunning:
+                spc.kill()  # SIGKILL, reaping it doesn't take long
+                spc.waitForFinished(1000)
         self.deleteLater()
 
 
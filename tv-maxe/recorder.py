@@ -0,0 +1,332 @@
+import os
+import re
+import time
+import logging
+import datetime
+import threading
+from urllib.parse import urlparse
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from protocols import ProtocolException
+from relay import StreamRelay
+from timeshift import HTTPSource
+from util import bytes2human
+
+log = logging.getLogger(__name__)
+WRITE_SIZE = 4 * 1024 * 1024
+READ_TIMEOUT = 0.5
+PARTIAL_SUFFIX = '.part'
+INVALID_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+def extension_for(head):
+    if head.startswith(b'FLV'):
+        return '.flv'
+    if head[:1] == b'\x47':
+        return '.ts'
+    if head[4:8] == b'ftyp':
+        return '.mp4'
+    return '.bin'
+
+
+class Recording:
+    # Copies a StreamRelay to a file on its own thread. Data is collected
+    # into WRITE_SIZE blocks so the disk only sees large sequential writes;
+    # if the disk can't keep up the relay skips ahead and the skipped bytes
+    # are counted as dropped.
+    def __init__(self, channel, directory, title=None, end_time=None):
+        self.channel = channel
+        self.title = title
+        self.end_time = end_time
+        name = '{0} - {1}'.format(title or channel.name, datetime.datetime.now().strftime("%Y-%m-%d %H-%M"))
+        name = INVALID_FILENAME_CHARS.sub('_', name).rstrip('. ')
+        self.base_path = os.path.join(directory, name)
+        self.path = self.base_path + PARTIAL_SUFFIX
+
+        self.relay = None
+        self.protocol = None  # the protocol session the recording keeps running
+        self.timeshift = None  # taken over from the player with its session
+        self.own_relay = None
+        self.teed = False  # reads the player's session
+        self.thread = None
+        self.stopped = False
+        self.started_at = None
+        self.finished_at = None
+        self.bytes_written = 0
+        self.dropped = 0
+        self.write_time = 0.0
+        self.error = None
+
+    def start(self, relay, live=True):
+        self.relay = relay
+        self.started_at = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, args=(live, ), name='Recording', daemon=True)
+        self.thread.start()
+
+    def run(self, live):
+        block = bytearray()
+        head = b''
+        if live:
+            prefix, cursor = self.relay.open_live_cursor()
+        else:
+            prefix, cursor = self.relay.open_cursor()
+        try:
+            with open(self.path, 'wb') as fh:
+                block += prefix
+                while not self.stopped:
+                    data, end = self.relay.read(cursor, READ_TIMEOUT)
+                    if not data:
+                        if self.relay.closed:
+                            break
+                        continue
+                    start = end - len(data)
+                    if start > cursor:
+                        self.dropped += start - cursor
+                    block += data
+                    if not self.relay.is_valid(start):
+                        del block[-len(data):]
+                        self.dropped += len(data)  # overwritten while copied
+                    cursor = end
+
+                    if len(block) >= WRITE_SIZE:
+                        head = head or bytes(block[:8])
+                        self.write(fh, block)
+                head = head or bytes(block[:8])
+                self.write(fh, block)
+                os.fsync(fh.fileno())
+        except OSError as e:
+            log.error('Recording {0} failed: {1}'.format(self.path, e))
+            self.error = e.strerror
+        finally:
+            self.relay.close_cursor()
+            self.finished_at = time.perf_counter()
+
+        if os.path.isfile(self.path):
+            final_path = self.base_path + extension_for(head)
+            os.replace(self.path, final_path)
+            self.path = final_path
+        log.debug('Recording finished: {0}'.format(self.metrics()))
+
+    def write(self, fh, block):
+        started = time.perf_counter()
+        fh.write(block)
+        self.write_time += time.perf_counter() - started
+        self.bytes_written += len(block)
+        del block[:]
+
+    def stop(self):
+        self.stopped = True
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def metrics(self):
+        elapsed = ((self.finished_at or time.perf_counter()) - self.started_at) if self.started_at else 0
+        return {
+            'path': self.path,
+            'bytes_written': self.bytes_written,
+            'dropped': self.dropped,
+            'duration': elapsed,
+            'average_rate': self.bytes_written / elapsed if elapsed else 0,
+            'write_rate': self.bytes_written / self.write_time if self.write_time else 0,
+            'error': self.error
+        }
+
+    def __str__(self):
+        metrics = self.metrics()
+        return '{0}: {1} at {2}/s, {3} dropped'.format(
+            os.path.basename(metrics['path']),
+            bytes2human(metrics['bytes_written']),
+            bytes2human(metrics['average_rate']),
+            bytes2human(metrics['dropped'])
+        )
+
+
+class Recorder(QObject):
+    # Records channels into recording/path. A channel that is playing is
+    # recorded from the stream already open (the player's relay), any other
+    # channel gets a protocol session of its own. When the player moves on
+    # while a recording still reads its session, the recorder takes the
+    # session over and stops it when the recording ends.
+    recording_started = pyqtSignal('PyQt_PyObject')
+    recording_finished = pyqtSignal('PyQt_PyObject')
+    recording_error = pyqtSignal('PyQt_PyObject', str)
+
+    def __init__(self, video_player, parent=None):
+        super().__init__(parent)
+        self.video_player = video_player
+        self.recordings = []
+        self.scheduled = []  # [channel, start, end, title, QTimer]
+        self.monitor_timer = QTimer(self)
+        self.monitor_timer.setInterval(1000)
+        self.monitor_timer.timeout.connect(self.check_recordings)
+        self.video_player.session_keeper = self.keep_session
+        QApplication.instance().aboutToQuit.connect(self.stop_all)
+
+    def recording_for(self, channel):
+        for recording in self.recordings:
+            if recording.channel.id == channel.id:
+                return recording
+        return None
+
+    def record(self, channel, title=None, end_time=None):
+        if self.recording_for(channel):
+            return None
+
+        directory = QApplication.instance().settings_manager.value(
+            "recording/path", os.path.expanduser("~/Videos"), str
+        )
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError as e:
+            self.recording_error.emit(channel, e.strerror)
+            return None
+
+        recording = Recording(channel, directory, title, end_time)
+        self.recordings.append(recording)
+        self.monitor_timer.start()
+
+        playing = self.video_player.channel
+        if playing and playing.id == channel.id and self.video_player.ready_url:
+            self.tee_session(recording)
+        else:
+            self.start_session(recording)
+        return recording
+
+    def tee_session(self, recording):
+        log.debug('Recording {0} from the playing stream'.format(recording.channel.id))
+        recording.teed = True
+        relay = self.video_player.tee_relay()
+        if relay:
+            self.start_recording(recording, relay, live=True)
+        else:
+            self.session_ready(recording, self.video_player.ready_url, self.video_player.protocol)
+
+    def keep_session(self, channel, protocol, timeshift):
+        # Called by the player instead of stopping its session; returns
+        # whether a recording took it over
+        for recording in self.recordings:
+            if recording.teed and not recording.protocol and recording.channel.id == channel.id:
+                log.debug('Keeping the session of {0} for its recording'.format(channel.id))
+                recording.protocol = protocol
+                recording.timeshift = timeshift
+                protocol.protocol_error.connect(
+                    lambda url, error, recording=recording: self.fail(recording, error)
+                )
+                return True
+        return False
+
+    def start_session(self, recording):
+        channel = recording.channel
+        url = channel.streamurls[0]
+        protocol_class = QApplication.instance().protocol_plugins.get(urlparse(url).scheme, None)
+        if not protocol_class:
+            self.fail(recording, "No suitable protocol found for {0}".format(url))
+            return
+
+        log.debug('Recording {0} via {1}'.format(channel.id, protocol_class.name))
+        try:
+            recording.protocol = protocol_class(self)
+            recording.protocol.protocol_ready.connect(
+                lambda ready_url, recording=recording: self.session_ready(recording, ready_url, recording.protocol)
+            )
+            recording.protocol.protocol_error.connect(
+                lambda url, error, recording=recording: self.fail(recording, error)
+            )
+            recording.protocol.load_url(url, channel.args(url))
+        except ProtocolException as e:
+            self.fail(recording, e.message)
+
+    def session_ready(self, recording, ready_url, protocol):
+        # Protocols without a relay of their own (SopCast) serve the stream
+        # locally, reading ready_url again doesn't reach the upstream server
+        if protocol.playlist:
+            self.fail(recording, "Playlist (HLS) streams can't be recorded")
+            return
+        relay = getattr(protocol, 'relay', None)
+        if not relay:
+            relay = recording.own_relay = StreamRelay(HTTPSource(ready_url))
+            relay.start()
+        self.start_recording(recording, relay, live=False)
+
+    def start_recording(self, recording, relay, live):
+        recording.start(relay, live)
+        self.recording_started.emit(recording)
+
+    def stop(self, recording):
+        recording.stop()
+        self.check_recordings()
+
+    def fail(self, recording, error):
+        log.error('Cannot record {0}: {1}'.format(recording.channel.id, error))
+        recording.error = error
+        recording.stop()
+        self.release(recording)
+        self.recording_error.emit(recording.channel, error)
+
+    def check_recordings(self):
+        # Ends recordings that reached their end time and reports the ones
+        # whose writer finished (stopped, end of stream or disk error)
+        now = time.time()
+        for recording in list(self.recordings):
+            if recording.end_time and now >= recording.end_time:
+                recording.stop()
+            if recording.stopped and not recording.thread:
+                self.release(recording)  # its protocol never got ready
+            elif recording.thread and not recording.is_running():
+                self.release(recording)
+                if recording.error:
+                    self.recording_error.emit(recording.channel, recording.error)
+                else:
+                    self.recording_finished.emit(recording)
+        if not self.recordings:
+            self.monitor_timer.stop()
+
+    def release(self, recording):
+        if recording in self.recordings:
+            self.recordings.remove(recording)
+        if recording.own_relay:
+            recording.own_relay.stop()
+        if recording.timeshift:
+            recording.timeshift.stop()
+            recording.timeshift = None
+        if recording.protocol:
+            for signal in [recording.protocol.protocol_ready, recording.protocol.protocol_error]:
+                try:
+                    signal.disconnect()
+                except TypeError:
+                    pass  # a session taken over from the player has no ready handler
+            recording.protocol.stop()
+            recording.protocol = None
+
+    def schedule(self, channel, start_time, end_time, title=None):
+        # Records channel from start_time to end_time (epoch seconds)
+        timer = QTimer(self)
+        timer.setSingleShot(True)
+        entry = [channel, start_time, end_time, title, timer]
+        timer.timeout.connect(lambda entry=entry: self.scheduled_start(entry))
+        timer.start(max(0, int((start_time - time.time()) * 1000)))
+        self.scheduled.append(entry)
+        log.debug('Scheduled recording of {0} ({1}) at {2}'.format(
+            channel.id, title, datetime.datetime.fromtimestamp(start_time)
+        ))
+        return entry
+
+    def unschedule(self, entry):
+        if entry in self.scheduled:
+            entry[4].stop()
+            self.scheduled.remove(entry)
+
+    def scheduled_start(self, entry):
+        self.unschedule(entry)
+        channel, start_time, end_time, title, timer = entry
+        self.record(channel, title, end_time)
+
+    def stop_all(self):
+        for entry in list(self.scheduled):
+            self.unschedule(entry)
+        for recording in list(self.recordings):
+            recording.stop()
+            if recording.thread:
+                recording.thread.join(READ_TIMEOUT * 4)
+            self.release(recording)
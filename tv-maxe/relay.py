@@ -0,0 +1,120 @@
+import logging
+import threading
+
+from ringbuffer import RingBuffer, BUF_SIZE
+
+log = logging.getLogger(__name__)
+RELAY_CAPACITY = 8 * 1024 * 1024
+
+class StreamRelay:
+    # Reads a stream once on its own thread into a RingBuffer, so any number
+    # of clients can read it at their own pace. Each client keeps its own
+    # cursor (an absolute offset in the stream); the reader never waits for
+    # clients, one that falls behind the buffer skips forward to the oldest
+    # data still available.
+    #
+    # The first chunk of the stream (container header, stream metadata) is
+    # kept for the whole session and sent first to clients joining late.
+    def __init__(self, source, capacity=RELAY_CAPACITY, chunk_size=BUF_SIZE, buffer=None):
+        self.source = source
+        self.buffer = buffer or RingBuffer(capacity, chunk_size)
+        self.head = b''
+        self.thread = None
+
+    @property
+    def closed(self):
+        return self.buffer.closed
+
+    @property
+    def clients(self):
+        return self.buffer.readers
+
+    @property
+    def dropped(self):
+        return self.buffer.dropped
+
+    def start(self):
+        self.thread = threading.Thread(target=self.pump, name='StreamRelay', daemon=True)
+        self.thread.start()
+
+    def pump(self):
+        try:
+            while not self.buffer.closed:
+                count = self.buffer.fill(self.source)
+                if not count:
+                    break
+                if not self.head:
+                    self.head = bytes(self.buffer.region(0, count))
+        except Exception as e:
+            if not self.buffer.closed:
+                log.debug('Error while reading stream: {0}'.format(e))
+        finally:
+            log.debug('End of relayed stream: {0}'.format(self.buffer.metrics()))
+            self.buffer.close()
+
+    def open_cursor(self):
+        # Returns (prefix, cursor) for a new client: the stream head if the
+        # client doesn't start at the beginning of the stream
+        self.buffer.add_reader()
+        cursor = self.buffer.start_offset
+        return (self.head if cursor > 0 else b'', cursor)
+
+    def open_live_cursor(self):
+        # Like open_cursor(), but starting at the newest data
+        self.buffer.add_reader()
+        cursor = self.buffer.write_offset
+        return (self.head if cursor > 0 else b'', cursor)
+
+    def close_cursor(self):
+        self.buffer.remove_reader()
+
+    def read(self, cursor, timeout=None):
+        # Returns (memoryview, cursor after it); the view is empty at the end
+        # of the stream, or when nothing arrived within timeout
+        return self.buffer.read_view(cursor, timeout=timeout)
+
+    async def read_async(self, cursor):
+        return await self.buffer.read_view_async(cursor)
+
+    async def read_copy_async(self, cursor):
+        # Returns (bytes, cursor after them) copied out of the ring before
+        # anything is sent, or (None, cursor) when the producer overwrote
+        # the data at cursor while it was being copied. That cursor is
+        # behind the buffer, so reading it again skips to the oldest data.
+        data, end = await self.read_async(cursor)
+        chunk = bytes(data)
+        if not self.is_valid(end - len(chunk)):
+            return (None, end - len(chunk))
+        return (chunk, end)
+
+    def is_valid(self, cursor):
+        # Whether data returned by read() before cursor is still intact
+        return self.buffer.is_valid(cursor)
+
+    def metrics(self):
+        return self.buffer.metrics()
+
+    def stop(self):
+        self.buffer.close()
+
+    def endpoint(self, content_type):
+        # StreamServer handler sending the relayed stream to each client
+        async def handler(request, response):
+            prefix, cursor = self.open_cursor()
+            try:
+                await response.send_headers(200, {'Content-Type': content_type})
+                if request.method == 'HEAD':
+                    return
+                if prefix:
+                    await response.write(prefix)
+                while True:
+                    data, cursor = await self.read_copy_async(cursor)
+                    if data is None:
+                        log.debug('Relay data was overwritten before reaching {0}, resyncing'.format(request.peer))
+                        continue
+                    if not data:
+                        break
+                    await response.write(data)
+            finally:
+                self.close_cursor()
+        return handler
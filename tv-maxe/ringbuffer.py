@@ -0,0 +1,153 @@
+import time
+import asyncio
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+BUF_SIZE = 64 * 1024
+EMPTY_VIEW = memoryview(b'')
+
+def wake_future(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class RingBuffer:
+    # A preallocated byte ring for streams with one producer and any number
+    # of readers. Positions are absolute stream offsets; a reader gets
+    # memoryview slices of the ring instead of copies, so it must check
+    # is_valid() after using one in case the producer overwrote it meanwhile.
+    #
+    # The producer always fills the chunk_size bytes ahead of write_offset,
+    # so those are excluded from what readers can see.
+    def __init__(self, capacity, chunk_size=BUF_SIZE):
+        if capacity < 2 * chunk_size:
+            raise ValueError('Ring buffer capacity must be at least two chunks')
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.allocate()
+        self.write_offset = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.waiters = []  # (event loop, future) of readers awaiting data
+
+        self.created_at = time.perf_counter()
+        self.bytes_read = 0
+        self.dropped = 0
+        self.readers = 0
+
+    def allocate(self):
+        self.buffer = bytearray(self.capacity)
+        self.view = memoryview(self.buffer)
+
+    @property
+    def start_offset(self):
+        # Oldest stream offset readers can still get
+        return max(0, self.write_offset - (self.capacity - self.chunk_size))
+
+    def fill(self, source):
+        # Reads the next chunk of source straight into the ring. Sources
+        # without readinto() (librtmp streams) are read and copied instead.
+        # Returns the number of bytes stored, 0 at the end of the stream.
+        region = self.region(self.write_offset, self.chunk_size)
+        if hasattr(source, 'readinto'):
+            count = source.readinto(region) or 0
+        else:
+            data = source.read(len(region))
+            count = len(data)
+            region[:count] = data
+
+        with self.condition:
+            self.write_offset += count
+            self.notify()
+        return count
+
+    def write(self, data):
+        # Copies data into the ring, wrapping around as needed
+        data = memoryview(data)
+        while data:
+            region = self.region(self.write_offset, min(len(data), self.chunk_size))
+            count = len(region)
+            region[:] = data[:count]
+            data = data[count:]
+            with self.condition:
+                self.write_offset += count
+                self.notify()
+
+    def read_view(self, cursor, max_size=None, timeout=None):
+        # Returns (memoryview, cursor after it) with the data available at
+        # cursor; a reader that fell behind skips to start_offset. The view
+        # is empty at the end of the stream or when timeout expires.
+        with self.condition:
+            while cursor >= self.write_offset and not self.closed:
+                if not self.condition.wait(timeout):
+                    return (EMPTY_VIEW, cursor)
+
+            if cursor < self.start_offset:
+                self.dropped += self.start_offset - cursor
+                log.debug('Ring buffer reader fell behind, skipping {0} bytes'.format(self.start_offset - cursor))
+                cursor = self.start_offset
+            end = self.write_offset
+
+        if cursor >= end:
+            return (EMPTY_VIEW, cursor)
+        region = self.region(cursor, min(end - cursor, max_size or self.chunk_size))
+        self.bytes_read += len(region)
+        return (region, cursor + len(region))
+
+    def region(self, offset, max_size):
+        # The longest contiguous view of the ring starting at stream offset,
+        # up to max_size bytes
+        pos = offset % self.capacity
+        return self.view[pos:pos + min(max_size, self.capacity - pos)]
+
+    async def read_view_async(self, cursor, max_size=None):
+        # read_view() for coroutines: waits on the event loop instead of
+        # blocking its thread
+        loop = asyncio.get_event_loop()
+        while True:
+            with self.condition:
+                if cursor < self.write_offset or self.closed:
+                    break
+                future = loop.create_future()
+                self.waiters.append((loop, future))
+            await future
+        return self.read_view(cursor, max_size, timeout=0)
+
+    def notify(self):
+        # Called with the condition held
+        self.condition.notify_all()
+        for loop, future in self.waiters:
+            try:
+                loop.call_soon_threadsafe(wake_future, future)
+            except RuntimeError:
+                pass  # loop already closed
+        self.waiters = []
+
+    def is_valid(self, cursor):
+        return cursor >= self.start_offset
+
+    def add_reader(self):
+        with self.condition:
+            self.readers += 1
+
+    def remove_reader(self):
+        with self.condition:
+            self.readers -= 1
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.notify()
+
+    def metrics(self):
+        elapsed = max(time.perf_counter() - self.created_at, 0.001)
+        return {
+            'capacity': self.capacity,
+            'fill': self.write_offset - self.start_offset,
+            'written': self.write_offset,
+            'read': self.bytes_read,
+            'dropped': self.dropped,
+            'readers': self.readers,
+            'write_rate': self.write_offset / elapsed
+        }
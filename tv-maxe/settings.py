@@ -47,6 +47,14 @@ class SettingsDialog(QDialog):
             self.settings_manager.value("recording/path", os.path.expanduser("~/Videos"), str)
         )
 
+        # Playback settings
+        self.timeshift_checkbox.setChecked(
+            self.settings_manager.value("timeshift/enabled", False, bool)
+        )
+        self.prewarm_checkbox.setChecked(
+            self.settings_manager.value("player/prewarm", False, bool)
+        )
+
         # Sopcast Settings
         self.sopcast_static_ports.setChecked(
             self.settings_manager.value("sopcast/staticports", False, bool)
@@ -167,6 +175,10 @@ class SettingsDialog(QDialog):
         self.settings_manager.setValue("trayicon", self.show_trayicon_checkbox.isChecked())
         self.settings_manager.setValue("recording/path", self.recording_path_lineedit.text())
 
+        # Playback settings
+        self.settings_manager.setValue("timeshift/enabled", self.timeshift_checkbox.isChecked())
+        self.settings_manager.setValue("player/prewarm", self.prewarm_checkbox.isChecked())
+
         # Sopcast Settings
         self.settings_manager.setValue("sopcast/staticports", self.sopcast_static_ports.isChecked())
         self.settings_manager.setValue("sopcast/inport", self.local_port_spinbox.value())
@@ -0,0 +1,228 @@
+import time
+import asyncio
+import logging
+import ipaddress
+import threading
+from urllib.parse import urlparse, parse_qs
+
+from util import bytes2human
+
+log = logging.getLogger(__name__)
+MAX_HEADER_SIZE = 16 * 1024
+SHUTDOWN_TIMEOUT = 5
+STATUS_REASONS = {
+    200: 'OK',
+    206: 'Partial Content',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    416: 'Range Not Satisfiable',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable'
+}
+
+def current_task():
+    if hasattr(asyncio, 'current_task'):
+        return asyncio.current_task()
+    return asyncio.Task.current_task()  # Python < 3.7
+
+
+class StreamRequest:
+    def __init__(self, method, target, headers, peer):
+        self.method = method
+        self.target = target
+        self.headers = headers  # lower-case names
+        self.peer = peer
+        url = urlparse(target)
+        self.path = url.path
+        self.query = parse_qs(url.query)
+
+
+class StreamResponse:
+    def __init__(self, writer, stats):
+        self.writer = writer
+        self.stats = stats
+        self.headers_sent = False
+
+    async def send_headers(self, status=200, headers=None):
+        lines = ['HTTP/1.1 {0} {1}'.format(status, STATUS_REASONS.get(status, ''))]
+        headers = dict(headers or {})
+        headers.setdefault('Connection', 'close')
+        for name, value in headers.items():
+            lines.append('{0}: {1}'.format(name, value))
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        self.headers_sent = True
+        self.stats.status = status
+        await self.writer.drain()
+
+    async def write(self, data):
+        # drain() is where a slow client pushes back on its handler
+        self.writer.write(data)
+        self.stats.bytes_sent += len(data)
+        await self.writer.drain()
+
+
+class ConnectionStats:
+    def __init__(self, peer):
+        self.peer = peer
+        self.path = None
+        self.status = None
+        self.bytes_sent = 0
+        self.started_at = time.perf_counter()
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.started_at
+
+    def __str__(self):
+        return '{0} {1}: {2}, {3} in {4:.1f} s'.format(
+            self.peer, self.path, self.status, bytes2human(self.bytes_sent), self.duration
+        )
+
+
+class StreamServer:
+    # Hosts every local streaming endpoint (protocol relays, Chromecast
+    # casting, timeshift) on one asyncio event loop running in its own
+    # thread. Endpoints are coroutines handler(request, response) mounted on
+    # a path; only public ones answer clients outside of this machine.
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.servers = {}  # host -> (asyncio.Server, port)
+        self.endpoints = {}  # path -> (handler, public)
+        self.connections = {}  # asyncio.Task -> ConnectionStats
+        self.started = threading.Event()
+        self.lock = threading.Lock()  # listen() is called from several threads
+
+    def start(self):
+        if self.thread:
+            return
+        self.started.clear()
+        self.thread = threading.Thread(target=self.run, name='StreamServer', daemon=True)
+        self.thread.start()
+        self.started.wait()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+            log.debug('Stream server stopped')
+
+    def call(self, coro, timeout=None):
+        # Runs coro on the server loop from any other thread and waits for it
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def listen(self, host='127.0.0.1', port=0):
+        # Returns the port the server listens on for host, opening it first
+        # if needed
+        with self.lock:
+            self.start()
+            if host not in self.servers:
+                server = self.call(asyncio.start_server(self.handle_connection, host, port))
+                self.servers[host] = (server, server.sockets[0].getsockname()[1])
+                log.debug('Stream server listening on {0}:{1}'.format(host, self.servers[host][1]))
+            return self.servers[host][1]
+
+    def add_endpoint(self, path, handler, public=False):
+        self.endpoints[path] = (handler, public)
+
+    def remove_endpoint(self, path):
+        # Unmounts path and disconnects the clients it is serving
+        if self.endpoints.pop(path, None) and self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.close_connections, path)
+
+    def url_for(self, path, host='127.0.0.1'):
+        return 'http://{0}:{1}{2}'.format(host, self.listen(host), path)
+
+    def close_connections(self, path=None):
+        for task, stats in list(self.connections.items()):
+            if path is None or stats.path == path:
+                task.cancel()
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername') or ('', 0)
+        stats = ConnectionStats(peer[0])
+        task = current_task()
+        self.connections[task] = stats
+        response = StreamResponse(writer, stats)
+        try:
+            request = await self.read_request(reader, peer[0])
+            if not request:
+                await response.send_headers(400)
+                return
+
+            stats.path = request.path
+            handler, public = self.endpoints.get(request.path, (None, False))
+            if not handler:
+                await response.send_headers(404)
+            elif not public and not ipaddress.ip_address(peer[0]).is_loopback:
+                await response.send_headers(403)
+            else:
+                await handler(request, response)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception:
+            log.exception('Error while serving {0}'.format(stats.path))
+            if not response.headers_sent:
+                try:
+                    await response.send_headers(500)
+                except ConnectionError:
+                    pass
+        finally:
+            writer.close()
+            del self.connections[task]
+            log.debug('Stream client done: {0}'.format(stats))
+
+    async def read_request(self, reader, peer):
+        try:
+            data = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return None
+        if len(data) > MAX_HEADER_SIZE:
+            return None
+
+        lines = data.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            return None
+
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        return StreamRequest(method, target, headers, peer)
+
+    def stats(self):
+        return [str(stats) for stats in list(self.connections.values())]
+
+    def stop(self):
+        # Stops accepting clients, cancels the ones being served and waits
+        # for them to finish before stopping the loop
+        if not self.loop or not self.loop.is_running():
+            return
+        log.debug('Stopping stream server, {0} clients connected'.format(len(self.connections)))
+        try:
+            self.call(self.shutdown(), SHUTDOWN_TIMEOUT)
+        except Exception as e:
+            log.debug('Stream server did not shut down cleanly: {0}'.format(e))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(SHUTDOWN_TIMEOUT)
+        with self.lock:
+            self.thread = None
+            self.servers = {}
+
+    async def shutdown(self):
+        for server, port in self.servers.values():
+            server.close()
+        tasks = list(self.connections.keys())
+        self.close_connections()
+        if tasks:
+            await asyncio.wait(tasks, timeout=SHUTDOWN_TIMEOUT)
+        for server, port in self.servers.values():
+            await server.wait_closed()
@@ -0,0 +1,148 @@
+import os
+import re
+import glob
+import mmap
+import shutil
+import logging
+import tempfile
+import urllib.request
+
+import paths
+from ringbuffer import RingBuffer, BUF_SIZE
+from relay import StreamRelay
+
+log = logging.getLogger(__name__)
+SEGMENT_SIZE = 16 * 1024 * 1024
+DEFAULT_WINDOW = 256 * 1024 * 1024
+RANGE_RE = re.compile(r'bytes=(\d+)-')
+
+class SegmentedRingBuffer(RingBuffer):
+    # A RingBuffer kept on disk: the ring is a list of memory-mapped segment
+    # files, created as the stream first reaches them and then reused
+    def __init__(self, directory, capacity, segment_size=SEGMENT_SIZE, chunk_size=BUF_SIZE):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.segments = []  # (file object, mmap, memoryview)
+        super().__init__(max(capacity // segment_size, 2) * segment_size, chunk_size)
+
+    def allocate(self):
+        pass  # segments are mapped on first use
+
+    def segment(self, index):
+        while len(self.segments) <= index:
+            path = os.path.join(self.directory, 'segment-{0}'.format(len(self.segments)))
+            fh = open(path, 'w+b')
+            fh.truncate(self.segment_size)
+            mapped = mmap.mmap(fh.fileno(), self.segment_size)
+            self.segments.append((fh, mapped, memoryview(mapped)))
+        return self.segments[index][2]
+
+    def region(self, offset, max_size):
+        pos = offset % self.capacity
+        index, segment_pos = divmod(pos, self.segment_size)
+        view = self.segment(index)
+        return view[segment_pos:segment_pos + min(max_size, self.segment_size - segment_pos)]
+
+    def release(self):
+        for fh, mapped, view in self.segments:
+            try:
+                view.release()
+                mapped.close()
+            except BufferError:
+                pass  # a reader still holds a slice, the mapping goes with it
+            fh.close()
+        self.segments = []
+
+
+class HTTPSource:
+    # Opens the URL on the first read, so connecting happens on the relay
+    # thread instead of the caller's
+    def __init__(self, url):
+        self.url = url
+        self.response = None
+
+    def readinto(self, buffer):
+        if not self.response:
+            self.response = urllib.request.urlopen(self.url)
+        return self.response.readinto(buffer)
+
+    def close(self):
+        if self.response:
+            self.response.close()
+
+
+class Timeshift:
+    # Records a live stream into a window of memory-mapped segment files
+    # under TIMESHIFT_DIR and serves it back over the stream server with
+    # byte range support. The player can pause, seek back within the window
+    # and catch up again while the upstream connection keeps being read.
+    def __init__(self, stream_server, url, window=DEFAULT_WINDOW, segment_size=SEGMENT_SIZE):
+        self.stream_server = stream_server
+        self.source = HTTPSource(url)
+        self.directory = tempfile.mkdtemp(prefix='session-', dir=paths.TIMESHIFT_DIR)
+        self.buffer = SegmentedRingBuffer(self.directory, window, segment_size)
+        self.relay = StreamRelay(self.source, buffer=self.buffer)
+        self.path = '/timeshift/{0}'.format(id(self))
+
+    def start(self):
+        # Returns the URL the player should open
+        log.debug('Timeshifting {0} with a {1} byte window'.format(self.source.url, self.buffer.capacity))
+        self.relay.start()
+        self.stream_server.add_endpoint(self.path, self.handle_request)
+        return self.stream_server.url_for(self.path)
+
+    async def handle_request(self, request, response):
+        match = RANGE_RE.match(request.headers.get('range', ''))
+        if match:
+            cursor = int(match.group(1))
+            if cursor < self.buffer.start_offset or cursor > self.buffer.write_offset:
+                await response.send_headers(416, {'Content-Range': 'bytes */{0}'.format(self.buffer.write_offset)})
+                return
+            prefix = b''
+            # The stream goes on past what is buffered now, so the range
+            # is open-ended rather than claiming an end it then streams past
+            await response.send_headers(206, {
+                'Accept-Ranges': 'bytes',
+                'Content-Range': 'bytes {0}-/*'.format(cursor)
+            })
+        else:
+            cursor = self.buffer.start_offset
+            prefix = self.relay.head if cursor > 0 else b''
+            await response.send_headers(200, {'Accept-Ranges': 'bytes'})
+
+        if request.method == 'HEAD':
+            return
+        self.buffer.add_reader()
+        try:
+            if prefix:
+                await response.write(prefix)
+            while True:
+                data, end = await self.relay.read_copy_async(cursor)
+                if not data or end - len(data) != cursor:
+                    # End of the stream, or the data at cursor left the
+                    # window: a gap would break the byte offsets the player
+                    # seeks by, so it reconnects with a Range instead
+                    break
+                await response.write(data)
+                cursor = end
+        finally:
+            self.buffer.remove_reader()
+
+    def metrics(self):
+        metrics = self.buffer.metrics()
+        metrics['window'] = self.buffer.capacity
+        return metrics
+
+    def stop(self):
+        log.debug('Stopping timeshift: {0}'.format(self.metrics()))
+        self.stream_server.remove_endpoint(self.path)
+        self.relay.stop()
+        self.source.close()
+        self.buffer.release()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @staticmethod
+    def remove_stale():
+        for directory in glob.glob(os.path.join(paths.TIMESHIFT_DIR, 'session-*')):
+            log.debug('Removing stale timeshift session: {0}'.format(directory))
+            shutil.rmtree(directory, ignore_errors=True)
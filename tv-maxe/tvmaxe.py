@@ -10,6 +10,8 @@ from PyQt5 import QtCore, QtWidgets, uic
 from PyQt5.QtGui import QIcon, QPixmap
 
 from settingsmanager import SettingsManager
+from network import NetworkService
+from streamserver import StreamServer
 from mainwindow import TVMaxeMainWindow
 
 log = logging.getLogger(__name__)
@@ -28,6 +30,13 @@ class TVMaxe(QtWidgets.QApplication):
         log.info('{0} {1}'.format(self.applicationName(), self.applicationVersion()))
 
         self.settings_manager = SettingsManager()
+        self.network = NetworkService(
+            self,
+            self.settings_manager.value("network/max_requests", 8, int)
+        )
+        self.stream_server = StreamServer()
+        self.stream_server.start()
+        self.aboutToQuit.connect(self.stream_server.stop)
 
         self.init_plugins()
 
@@ -11,6 +11,9 @@ from protocols import ProtocolException
 from models.channel import Channel
 from chromecast import Chromecast
 from fullscreentoolbar import FullscreenToolbar
+from prewarm import ChannelPrewarmer
+from zapstats import ZapStats
+from timeshift import Timeshift, DEFAULT_WINDOW
 
 log = logging.getLogger(__name__)
 
@@ -39,6 +42,10 @@ class VideoPlayer(QWidget):
         self.player.wid = int(self.winId())
         self.player.cursor_autohide = False
         self.protocol = None
+        self.ready_url = None
+        self.timeshift = None
+        self.session_keeper = None  # callable(channel, protocol, timeshift) that may take the session over
+        self.prewarmer = ChannelPrewarmer(self)
         self.fullscreen_toolbar = FullscreenToolbar(self)
 
         self.player.register_key_binding('MOUSE_LEAVE', self.mouse_leave)
@@ -48,6 +55,8 @@ class VideoPlayer(QWidget):
         self.mousehide_timer.setSingleShot(True)
         self.mousehide_timer.timeout.connect(self._hide_mouse)
 
+        Timeshift.remove_stale()
+
         self.chromecast_manager = Chromecast(self)
         self.chromecast_manager.devices_found.connect(self.chromecast_devices_found)
         self.chromecast_manager.device_connected.connect(self.chromecast_device_connected)
@@ -72,13 +81,22 @@ class VideoPlayer(QWidget):
         log.debug('Selected url: {0}'.format(url))
         url_components = urlparse(url)
         app = QApplication.instance()
-        if app.protocol_plugins.get(url_components.scheme, None):
+        warm_session = self.prewarmer.take(channel, url)
+        if warm_session:
+            ZapStats.mark('load_url', warm_session.protocol.name, url, warm=True)
+            self.protocol = warm_session.protocol
+            self.protocol.protocol_ready.connect(self.protocol_ready)
+            self.protocol.protocol_error.connect(self.protocol_error)
+            if warm_session.ready_url:
+                self.protocol_ready(warm_session.ready_url)
+        elif app.protocol_plugins.get(url_components.scheme, None):
             protocol_class = app.protocol_plugins[url_components.scheme]
             log.debug('Using {0} to process {1}'.format(protocol_class.name, url))
             try:
                 self.protocol = protocol_class(self)
                 self.protocol.protocol_ready.connect(self.protocol_ready)
                 self.protocol.protocol_error.connect(self.protocol_error)
+                ZapStats.mark('load_url', protocol_class.name, url)
                 self.protocol.load_url(url, channel.args(url))
             except ProtocolException as e:
                 log.error(e.message)
@@ -110,13 +128,43 @@ class VideoPlayer(QWidget):
             self.chromecast_manager.play_url(self.player.path)
 
     def protocol_ready(self, url):
+        ZapStats.mark('protocol_ready')
         self.player.observe_property('core-idle', self.idle_observer)
         self.player.register_event_callback(self.event_observer)
         log.debug('Ready to play {0} via {1}'.format(self.channel.id, url))
+        self.ready_url = url
         if self.chromecast_manager.current_device:
             self.chromecast_manager.play_url(url)
         else:
-            self.player.play(url)
+            self.player.play(self.start_timeshift(url))
+
+    def start_timeshift(self, url):
+        # Returns the URL mpv should play: the timeshift buffer's if enabled.
+        # Only continuous streams are buffered; mpv resolves a playlist's
+        # segments relative to its URL, which must stay the original one.
+        settings = QApplication.instance().settings_manager
+        if not settings.value("timeshift/enabled", False, bool) or self.protocol.playlist:
+            return url
+
+        self.stop_timeshift()
+        self.timeshift = Timeshift(
+            QApplication.instance().stream_server,
+            url,
+            settings.value("timeshift/window_size", DEFAULT_WINDOW, int)
+        )
+        return self.timeshift.start()
+
+    def tee_relay(self):
+        # The StreamRelay of the stream being played, if any, so it can be
+        # read again (e.g. recorded) without opening another connection
+        if self.timeshift:
+            return self.timeshift.relay
+        return getattr(self.protocol, 'relay', None)
+
+    def stop_timeshift(self):
+        if self.timeshift:
+            self.timeshift.stop()
+            self.timeshift = None
 
     def protocol_error(self, url, error_message):
         log.debug('Protocol returned error, stopping playback')
@@ -126,10 +174,19 @@ class VideoPlayer(QWidget):
         self.exit_fullscreen()
         self.playback_error.emit(self.channel)
 
-    def deactivate_protocol(self):
+    def deactivate_protocol(self, keep_warm=False):
+        # keep_warm: hand the session to the prewarmer instead of stopping
+        # it, the channel may well be played again soon
+        ready_url, self.ready_url = self.ready_url, None
         self.protocol.protocol_ready.disconnect()
         self.protocol.protocol_error.disconnect()
-        self.protocol.stop()
+        if self.session_keeper and self.session_keeper(self.channel, self.protocol, self.timeshift):
+            self.timeshift = None  # still read by whoever kept the session
+        else:
+            self.stop_timeshift()
+            url = self.channel.streamurls[self.channel.play_index]
+            if not keep_warm or not self.prewarmer.keep(self.channel, url, self.protocol, ready_url):
+                self.protocol.stop()
         self.protocol = None
 
     def switch_pause(self):
@@ -145,13 +202,17 @@ class VideoPlayer(QWidget):
             else:
                 self.player.pause = True
 
-    def stop(self):
+    def stop(self, zapping=False):
+        # zapping: stopped to play another channel, whose switch is being
+        # timed already
         log.debug('stop')
+        if not zapping:
+            ZapStats.abort()
         self.unregister_observers()
         self.player.play('')
         self.exit_fullscreen()
         if self.protocol:
-            self.deactivate_protocol()
+            self.deactivate_protocol(keep_warm=zapping)
         if self.chromecast_manager.current_device:
             self.chromecast_manager.stop()
         self.playback_stopped.emit(self.channel)
@@ -177,6 +238,7 @@ class VideoPlayer(QWidget):
     def chromecast_playback_started(self):
         # We don't have a self.channel if we're playing the splash screen
         if self.channel:
+            ZapStats.mark('playing')
             self.playback_started.emit(self.channel)
 
             if self.player.path:
@@ -261,6 +323,7 @@ class VideoPlayer(QWidget):
         log.debug('idle_observer: {0} {1}'.format(name, value))
         if value == False:
             log.debug('Started playback')
+            ZapStats.mark('playing')
             self.playback_started.emit(self.channel)
         else:
             if not self.player.paused_for_cache:
@@ -288,6 +351,7 @@ class VideoPlayer(QWidget):
 
     def quit(self):
         self.stop()
+        self.prewarmer.clear()
         if self.chromecast_manager.current_device:
             self.chromecast_manager.disconnect()
 
@@ -0,0 +1,218 @@
+import math
+import time
+import json
+import logging
+import threading
+from collections import deque
+from PyQt5 import uic
+from PyQt5.QtWidgets import QDialog, QFileDialog, QMessageBox
+from PyQt5.QtGui import QStandardItemModel, QStandardItem
+
+log = logging.getLogger(__name__)
+MAX_RECORDS = 500
+
+# Stages of a channel switch, in the order they happen
+STAGES = ['activated', 'stopped', 'load_url', 'protocol_ready', 'playing']
+# (name, from stage, to stage) intervals reported by ZapStats.summary()
+INTERVALS = [
+    ('teardown', 'activated', 'stopped'),
+    ('load', 'stopped', 'load_url'),
+    ('connect', 'load_url', 'protocol_ready'),
+    ('first_frame', 'protocol_ready', 'playing'),
+    ('total', 'activated', 'playing')
+]
+
+def percentile(values, pct):
+    # Nearest-rank percentile of an already sorted list
+    if not values:
+        return None
+    rank = max(math.ceil(pct / 100.0 * len(values)), 1)
+    return values[rank - 1]
+
+
+class ZapRecord:
+    def __init__(self, channel_id, channel_name):
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.protocol = None
+        self.url = None
+        self.warm = False
+        self.retries = 0
+        self.started_at = time.time()
+        self.stages = {'activated': time.perf_counter()}
+
+    def interval(self, start, end):
+        if start not in self.stages or end not in self.stages:
+            return None
+        return self.stages[end] - self.stages[start]
+
+    def to_dict(self):
+        activated = self.stages['activated']
+        return {
+            'channel_id': self.channel_id,
+            'channel_name': self.channel_name,
+            'protocol': self.protocol,
+            'url': self.url,
+            'warm': self.warm,
+            'retries': self.retries,
+            'started_at': self.started_at,
+            'stages_ms': {stage: (self.stages[stage] - activated) * 1000
+                          for stage in STAGES if stage in self.stages}
+        }
+
+
+class ZapStats:
+    # Timestamps every stage of a channel switch, from the user activating
+    # a channel until mpv leaves core-idle. 'playing' is marked from mpv's
+    # event thread, hence the lock.
+    current = None
+    records = deque(maxlen=MAX_RECORDS)
+    aborted = 0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def start(channel):
+        with ZapStats._lock:
+            if ZapStats.current:
+                ZapStats.aborted += 1
+            ZapStats.current = ZapRecord(channel.id, channel.name)
+
+    @staticmethod
+    def mark(stage, protocol=None, url=None, warm=False):
+        timestamp = time.perf_counter()
+        with ZapStats._lock:
+            record = ZapStats.current
+            if not record:
+                return
+            if stage == 'load_url' and 'load_url' in record.stages:
+                # Retrying with the next stream of the channel
+                record.retries += 1
+                record.stages.pop('protocol_ready', None)
+            if protocol:
+                record.protocol = protocol
+                record.url = url
+                record.warm = warm
+            record.stages[stage] = timestamp
+
+            if stage == 'playing':
+                ZapStats.records.append(record)
+                ZapStats.current = None
+                log.debug('Zapped to {0} via {1} in {2:.0f} ms'.format(
+                    record.channel_id, record.protocol, record.interval('activated', 'playing') * 1000
+                ))
+
+    @staticmethod
+    def abort():
+        with ZapStats._lock:
+            if ZapStats.current:
+                ZapStats.aborted += 1
+                ZapStats.current = None
+
+    @staticmethod
+    def summary():
+        with ZapStats._lock:
+            records = list(ZapStats.records)
+
+        def aggregate(key):
+            groups = {}
+            for record in records:
+                groups.setdefault(key(record), []).append(record)
+
+            result = {}
+            for name, group in groups.items():
+                result[name] = {'plays': len(group)}
+                for interval, start, end in INTERVALS:
+                    values = sorted(
+                        record.interval(start, end) * 1000 for record in group
+                        if record.interval(start, end) is not None
+                    )
+                    result[name][interval] = {'p50': percentile(values, 50), 'p95': percentile(values, 95)}
+            return result
+
+        return {
+            'plays': len(records),
+            'aborted': ZapStats.aborted,
+            'protocols': aggregate(lambda record: record.protocol or 'Unknown'),
+            'channels': aggregate(lambda record: record.channel_name or record.channel_id)
+        }
+
+    @staticmethod
+    def dump(path):
+        with ZapStats._lock:
+            records = [record.to_dict() for record in ZapStats.records]
+        with open(path, 'w') as fh:
+            json.dump({'summary': ZapStats.summary(), 'records': records}, fh, indent=2)
+        log.debug('Dumped {0} zap records to {1}'.format(len(records), path))
+
+    @staticmethod
+    def clear():
+        with ZapStats._lock:
+            ZapStats.records.clear()
+            ZapStats.aborted = 0
+
+
+class ZapStatsDialog(QDialog):
+    def __init__(self, parent=None):
+        super(QDialog, self).__init__(parent)
+        uic.loadUi('ui/zapStats.ui', self)
+
+        model = QStandardItemModel(0, 1 + len(INTERVALS) * 2)
+        labels = ['Protocol / Channel']
+        for interval, start, end in INTERVALS:
+            labels += ['{0} p50'.format(interval), '{0} p95'.format(interval)]
+        model.setHorizontalHeaderLabels(labels)
+        self.stats_treeview.setModel(model)
+        self.stats_treeview.setUniformRowHeights(True)
+
+        self.refresh_button.clicked.connect(self.refresh)
+        self.reset_button.clicked.connect(self.reset)
+        self.dump_button.clicked.connect(self.dump)
+        self.refresh()
+
+    def refresh(self):
+        summary = ZapStats.summary()
+        model = self.stats_treeview.model()
+        model.removeRows(0, model.rowCount())
+
+        for title, groups in [(self.tr("Protocols"), summary['protocols']),
+                              (self.tr("Channels"), summary['channels'])]:
+            parent = QStandardItem(title)
+            for name, stats in sorted(groups.items()):
+                row = [QStandardItem("{0} ({1})".format(name, stats['plays']))]
+                for interval, start, end in INTERVALS:
+                    for pct in ['p50', 'p95']:
+                        value = stats[interval][pct]
+                        row.append(QStandardItem('-' if value is None else '{0:.0f} ms'.format(value)))
+                parent.appendRow(row)
+            model.appendRow(parent)
+
+        self.stats_treeview.expandAll()
+        self.stats_treeview.resizeColumnToContents(0)
+        self.summary_label.setText(
+            self.tr("{0} channel switches measured, {1} abandoned before playback").format(
+                summary['plays'], summary['aborted']
+            )
+        )
+
+    def reset(self):
+        ZapStats.clear()
+        self.refresh()
+
+    def dump(self):
+        filename = QFileDialog.getSaveFileName(
+            self,
+            self.tr("Save zap statistics"),
+            "zapstats.json",
+            self.tr("JSON files (*.json)")
+        )[0]
+        if not filename:
+            return
+
+        try:
+            ZapStats.dump(filename)
+        except OSError as e:
+            QMessageBox.critical(
+                self,
+                self.tr("Error"),
+                self.tr("Cannot save zap statistics: {0}").format(e.strerror)
+            )